@@ -0,0 +1,44 @@
+"""lesson_plans timestamp defaults
+
+Revision ID: 5d1e8a7c9f20
+Revises: 3b9f0c2d7e41
+Create Date: 2026-10-17 11:02:51.640317
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '5d1e8a7c9f20'
+down_revision: Union[str, Sequence[str], None] = '3b9f0c2d7e41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Plans inserted through PostgREST never set the timestamps; the list cursor needs created_at
+    op.execute("UPDATE lesson_plans SET created_at = COALESCE(updated_at, now()) WHERE created_at IS NULL")
+    op.execute("UPDATE lesson_plans SET updated_at = created_at WHERE updated_at IS NULL")
+    op.alter_column('lesson_plans', 'created_at',
+                    existing_type=sa.DateTime(timezone=True),
+                    server_default=sa.text('now()'),
+                    nullable=False)
+    op.alter_column('lesson_plans', 'updated_at',
+                    existing_type=sa.DateTime(timezone=True),
+                    server_default=sa.text('now()'),
+                    nullable=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.alter_column('lesson_plans', 'updated_at',
+                    existing_type=sa.DateTime(timezone=True),
+                    server_default=None,
+                    nullable=True)
+    op.alter_column('lesson_plans', 'created_at',
+                    existing_type=sa.DateTime(timezone=True),
+                    server_default=None,
+                    nullable=True)
@@ -0,0 +1,42 @@
+"""add lesson_plans summary columns
+
+Revision ID: 8c4f2b6e1a93
+Revises: 5d1e8a7c9f20
+Create Date: 2026-10-17 13:27:08.512946
+
+Existing rows are left NULL; fill them in with
+`python -m app.jobs.backfill_plan_summaries`.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '8c4f2b6e1a93'
+down_revision: Union[str, Sequence[str], None] = '5d1e8a7c9f20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('lesson_plans', sa.Column('segment_count', sa.Integer(), nullable=True))
+    op.add_column('lesson_plans', sa.Column('linked_track_count', sa.Integer(), nullable=True))
+    op.add_column('lesson_plans', sa.Column('song_coverage', sa.Float(), nullable=True))
+    op.add_column('lesson_plans', sa.Column('avg_bpm', sa.Float(), nullable=True))
+    op.add_column('lesson_plans', sa.Column('low_intensity_seconds', sa.Integer(), nullable=True))
+    op.add_column('lesson_plans', sa.Column('medium_intensity_seconds', sa.Integer(), nullable=True))
+    op.add_column('lesson_plans', sa.Column('high_intensity_seconds', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('lesson_plans', 'high_intensity_seconds')
+    op.drop_column('lesson_plans', 'medium_intensity_seconds')
+    op.drop_column('lesson_plans', 'low_intensity_seconds')
+    op.drop_column('lesson_plans', 'avg_bpm')
+    op.drop_column('lesson_plans', 'song_coverage')
+    op.drop_column('lesson_plans', 'linked_track_count')
+    op.drop_column('lesson_plans', 'segment_count')
@@ -0,0 +1,54 @@
+"""add lesson_plans (user_id, created_at, id) list index
+
+Revision ID: a7e3d91c4b58
+Revises: 8c4f2b6e1a93
+Create Date: 2026-10-17 14:45:33.907215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7e3d91c4b58'
+down_revision: Union[str, Sequence[str], None] = '8c4f2b6e1a93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Summary columns returned by the plan list, carried in the index so pages are index-only scans
+LIST_COLUMNS = [
+    'theme',
+    'duration_minutes',
+    'updated_at',
+    'segment_count',
+    'linked_track_count',
+    'song_coverage',
+    'avg_bpm',
+    'low_intensity_seconds',
+    'medium_intensity_seconds',
+    'high_intensity_seconds',
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Built concurrently so plan writes aren't blocked while it builds
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_lesson_plans_user_id_created_at',
+            'lesson_plans',
+            ['user_id', sa.text('created_at DESC'), sa.text('id DESC')],
+            unique=False,
+            postgresql_include=LIST_COLUMNS,
+            postgresql_concurrently=True,
+        )
+        # Every user_id lookup can use the new index's leading column
+        op.drop_index('ix_lesson_plans_user_id', table_name='lesson_plans', postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index('ix_lesson_plans_user_id', 'lesson_plans', ['user_id'], unique=False, postgresql_concurrently=True)
+        op.drop_index('ix_lesson_plans_user_id_created_at', table_name='lesson_plans', postgresql_concurrently=True)
@@ -0,0 +1,124 @@
+"""add lesson_plans full-text and trigram search
+
+Revision ID: c2f5e8a1d347
+Revises: a7e3d91c4b58
+Create Date: 2026-10-17 16:02:51.240718
+
+Adds two generated columns, their GIN indexes and the search_lesson_plans()
+function used by both plan storage backends. Adding stored generated columns
+rewrites the table once.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'c2f5e8a1d347'
+down_revision: Union[str, Sequence[str], None] = 'a7e3d91c4b58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Keep in sync with LessonPlanDB.search_vector / search_text
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('english'::regconfig, theme), 'A') || "
+    "setweight(jsonb_to_tsvector('english'::regconfig, "
+    "jsonb_path_query_array(plan_json, '$.segments[*].name') || "
+    "jsonb_path_query_array(plan_json, '$.segments[*].sub_segments[*].name') || "
+    "jsonb_path_query_array(plan_json, '$.segments[*].song'), '[\"string\"]'), 'B') || "
+    "setweight(jsonb_to_tsvector('english'::regconfig, "
+    "jsonb_path_query_array(plan_json, '$.segments[*].description') || "
+    "jsonb_path_query_array(plan_json, '$.segments[*].sub_segments[*].description'), '[\"string\"]'), 'C')"
+)
+SEARCH_TEXT_SQL = (
+    "theme || ' ' || "
+    "jsonb_path_query_array(plan_json, '$.segments[*].name')::text || ' ' || "
+    "jsonb_path_query_array(plan_json, '$.segments[*].song')::text"
+)
+
+SEARCH_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION search_lesson_plans(
+    p_user_id text,
+    p_query text,
+    p_limit integer,
+    p_after_rank real DEFAULT NULL,
+    p_after_id uuid DEFAULT NULL
+)
+RETURNS TABLE (
+    id uuid,
+    theme text,
+    duration_minutes integer,
+    created_at timestamptz,
+    updated_at timestamptz,
+    segment_count integer,
+    linked_track_count integer,
+    song_coverage double precision,
+    avg_bpm double precision,
+    low_intensity_seconds integer,
+    medium_intensity_seconds integer,
+    high_intensity_seconds integer,
+    rank real
+)
+LANGUAGE sql STABLE
+AS $$
+    SELECT * FROM (
+        SELECT
+            p.id, p.theme, p.duration_minutes, p.created_at, p.updated_at,
+            p.segment_count, p.linked_track_count, p.song_coverage, p.avg_bpm,
+            p.low_intensity_seconds, p.medium_intensity_seconds, p.high_intensity_seconds,
+            (ts_rank_cd(p.search_vector, q.query) + word_similarity(p_query, p.search_text))::real AS rank
+        FROM lesson_plans p, websearch_to_tsquery('english', p_query) AS q(query)
+        WHERE p.user_id = p_user_id
+          AND (p.search_vector @@ q.query OR p_query <% p.search_text)
+    ) ranked
+    WHERE p_after_rank IS NULL OR (ranked.rank, ranked.id) < (p_after_rank, p_after_id)
+    ORDER BY ranked.rank DESC, ranked.id DESC
+    LIMIT p_limit
+$$
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.add_column('lesson_plans', sa.Column(
+        'search_vector', postgresql.TSVECTOR(), sa.Computed(SEARCH_VECTOR_SQL, persisted=True), nullable=True
+    ))
+    op.add_column('lesson_plans', sa.Column(
+        'search_text', sa.Text(), sa.Computed(SEARCH_TEXT_SQL, persisted=True), nullable=True
+    ))
+    op.execute(SEARCH_FUNCTION_SQL)
+    # Let PostgREST (Supabase) see the new function; a no-op elsewhere
+    op.execute("NOTIFY pgrst, 'reload schema'")
+
+    # Built concurrently so plan writes aren't blocked while they build
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_lesson_plans_search_vector',
+            'lesson_plans',
+            ['search_vector'],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            'ix_lesson_plans_search_text_trgm',
+            'lesson_plans',
+            ['search_text'],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_ops={'search_text': 'gin_trgm_ops'},
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_lesson_plans_search_text_trgm', table_name='lesson_plans', postgresql_concurrently=True)
+        op.drop_index('ix_lesson_plans_search_vector', table_name='lesson_plans', postgresql_concurrently=True)
+    op.execute('DROP FUNCTION IF EXISTS search_lesson_plans(text, text, integer, real, uuid)')
+    op.drop_column('lesson_plans', 'search_text')
+    op.drop_column('lesson_plans', 'search_vector')
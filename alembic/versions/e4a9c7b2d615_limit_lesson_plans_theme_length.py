@@ -0,0 +1,43 @@
+"""limit lesson_plans theme length
+
+Revision ID: e4a9c7b2d615
+Revises: c2f5e8a1d347
+Create Date: 2026-10-17 18:20:14.503162
+
+theme is an INCLUDE column of ix_lesson_plans_user_id_created_at, and an
+index tuple over ~2.7KB can't be stored, so an unbounded theme could make
+plan writes fail. Longer existing themes are truncated.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a9c7b2d615'
+down_revision: Union[str, Sequence[str], None] = 'c2f5e8a1d347'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Keep in sync with app.models.schemas.MAX_THEME_LENGTH
+MAX_THEME_LENGTH = 200
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(
+        f"UPDATE lesson_plans SET theme = left(theme, {MAX_THEME_LENGTH}) WHERE char_length(theme) > {MAX_THEME_LENGTH}"
+    )
+    # Added NOT VALID and validated in its own transaction, so plan writes aren't
+    # blocked while existing rows are checked
+    op.execute(
+        "ALTER TABLE lesson_plans ADD CONSTRAINT ck_lesson_plans_theme_length "
+        f"CHECK (char_length(theme) <= {MAX_THEME_LENGTH}) NOT VALID"
+    )
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TABLE lesson_plans VALIDATE CONSTRAINT ck_lesson_plans_theme_length")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('ck_lesson_plans_theme_length', 'lesson_plans', type_='check')
@@ -14,18 +14,74 @@ class Settings(BaseSettings):
     supabase_key: str
     supabase_service_key: str | None = None
     database_url: str | None = None
+    # Access tokens are verified locally with the JWT secret (HS256 projects) or the project's JWKS
+    supabase_jwt_secret: str | None = None
+    supabase_jwks_refresh_seconds: int = 600
+    # Verified-session cache (entries never outlive the access token)
+    session_cache_size: int = 10000
+    session_cache_max_ttl_seconds: int = 300
+    # Concurrent refreshes of the same refresh token are coalesced; the result is reused this long
+    token_refresh_reuse_seconds: float = 10.0
+
+    # Lesson plan storage: "supabase" (PostgREST) or "postgres" (direct pooled connection to DATABASE_URL)
+    plans_backend: str = "supabase"
+    database_pool_size: int = 10
+    database_max_overflow: int = 10
+    database_pool_timeout_seconds: float = 10.0
+    database_pool_recycle_seconds: int = 1800
+    # Set when DATABASE_URL points at a transaction-mode pooler (e.g. Supabase port 6543)
+    database_disable_prepared_statements: bool = False
 
     # Spotify
     spotify_client_id: str | None = None
     spotify_client_secret: str | None = None
     spotify_redirect_uri: str = "http://localhost:8000/api/spotify/callback"
+    spotify_timeout_seconds: float = 10.0
+    spotify_max_connections: int = 100
+    spotify_max_keepalive_connections: int = 20
+    # Spotify rate limiting (per worker process): token bucket + Retry-After handling
+    spotify_requests_per_second: float = 10.0
+    spotify_burst_size: int = 20
+    spotify_max_retries: int = 3
+    spotify_max_retry_wait_seconds: float = 30.0
 
     # GetSongBPM (fallback for audio features)
     getsongbpm_api_key: str | None = None
+    getsongbpm_timeout_seconds: float = 3.0
+    getsongbpm_max_connections: int = 20
+    getsongbpm_max_keepalive_connections: int = 10
+
+    # Shared upstream HTTP connection pools
+    http_connect_timeout_seconds: float = 5.0
+    http_keepalive_expiry_seconds: float = 30.0
+
+    # Audio features cache (in-process LRU in front of the track_features table).
+    # GetSongBPM tempos are fuzzy search matches, so they expire and Spotify is asked again
+    track_features_cache_size: int = 10000
+    getsongbpm_features_ttl_seconds: float = 7 * 24 * 3600
+
+    # Audio features lookup: start the fallback source after the hedge delay, give up after the budget
+    audio_features_hedge_delay_seconds: float = 0.3
+    audio_features_budget_seconds: float = 5.0
+
+    # Playlist contents cache (keyed by playlist snapshot)
+    playlist_cache_size: int = 200
+
+    # Full plan read cache (validated against updated_at on every read)
+    plan_cache_size: int = 1000
+
+    # Auto-saved plans are written in the background, spooled to disk until they land
+    plan_write_spool_dir: str = ".spool/plans"
+    plan_write_batch_size: int = 50
+    plan_write_max_retries: int = 5
+    plan_write_drain_timeout_seconds: float = 10.0
 
     # CORS
     cors_origins: str = "http://localhost:8000"
 
+    # Serve the internal counters (upstream throttling, plan writes) at GET /metrics
+    metrics_enabled: bool = False
+
     # Rate limiting for AI generation
     rate_limit_requests: int = 10  # Max AI generations per window
     rate_limit_window_hours: int = 24  # Time window in hours
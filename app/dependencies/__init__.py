@@ -1 +1 @@
-from .auth import get_current_user_id, get_optional_user_id
+from .auth import authenticate_request, get_current_user_id, get_optional_user_id
@@ -1,15 +1,51 @@
+import jwt
 from fastapi import Depends, HTTPException, Request, Response
 from starlette.responses import JSONResponse
 
-from app.services.supabase import get_supabase_client, SupabaseClient
+from app.services.session_cache import get_cached_session, cache_session
+from app.services.supabase import get_supabase_auth_client, SupabaseAuthClient
+from app.services.token_refresh import refresh_supabase_session
+from app.services.token_verifier import get_token_verifier, SupabaseTokenVerifier, SigningKeyUnavailable
 
 
-async def get_current_user_id(
+def _token_expiry(access_token: str) -> float | None:
+    """Read the exp claim of a token Supabase has already validated."""
+    try:
+        return jwt.decode(access_token, options={"verify_signature": False}).get("exp")
+    except jwt.InvalidTokenError:
+        return None
+
+
+async def _verify_access_token(
+    access_token: str,
+    auth_client: SupabaseAuthClient,
+    verifier: SupabaseTokenVerifier,
+) -> dict | None:
+    """Verify an access token (locally when possible) and cache the resulting session."""
+    try:
+        claims = await verifier.verify(access_token)
+        if claims:
+            return cache_session(access_token, claims["sub"], claims.get("email"), claims["exp"])
+    except SigningKeyUnavailable:
+        # Can't verify locally, ask Supabase Auth
+        try:
+            user_response = await auth_client.get_user(access_token)
+            if user_response and user_response.user:
+                return cache_session(
+                    access_token, user_response.user.id, user_response.user.email, _token_expiry(access_token)
+                )
+        except Exception:
+            pass  # Token expired or invalid
+    return None
+
+
+async def authenticate_request(
     request: Request,
-    client: SupabaseClient = Depends(get_supabase_client)
-) -> str:
+    auth_client: SupabaseAuthClient,
+    verifier: SupabaseTokenVerifier,
+) -> dict | None:
     """
-    Extract and verify user ID from auth cookie.
+    Get the session ({"user_id", "email"}) for the request's auth cookies, or None.
     Automatically refreshes the token if expired but refresh token is valid.
     """
     access_token = request.cookies.get("access_token")
@@ -17,38 +53,57 @@ async def get_current_user_id(
 
     # Try with existing access token first
     if access_token:
-        try:
-            user_response = client.auth.get_user(access_token)
-            if user_response and user_response.user:
-                return user_response.user.id
-        except Exception:
-            pass  # Token expired or invalid, try refresh
+        session = get_cached_session(access_token) or await _verify_access_token(access_token, auth_client, verifier)
+        if session:
+            return session
 
-    # No valid access token, try to refresh
+    # No valid access token, try to refresh (shared with concurrent requests using the same token)
     if refresh_token:
         try:
-            new_session = client.auth.refresh_session(refresh_token)
+            new_session = await refresh_supabase_session(auth_client, refresh_token)
             if new_session and new_session.session and new_session.user:
                 # Store the new tokens in request state so middleware can set cookies
                 request.state.new_access_token = new_session.session.access_token
                 request.state.new_refresh_token = new_session.session.refresh_token
                 request.state.token_expires_in = new_session.session.expires_in
-                return new_session.user.id
+                return cache_session(
+                    new_session.session.access_token,
+                    new_session.user.id,
+                    new_session.user.email,
+                    new_session.session.expires_at,
+                )
         except Exception:
             pass  # Refresh token also invalid
 
-    raise HTTPException(status_code=401, detail="Not authenticated")
+    return None
+
+
+async def get_current_user_id(
+    request: Request,
+    auth_client: SupabaseAuthClient = Depends(get_supabase_auth_client),
+    verifier: SupabaseTokenVerifier = Depends(get_token_verifier),
+) -> str:
+    """
+    Extract and verify user ID from auth cookie.
+    Verified sessions are cached, and tokens are verified locally when possible.
+    Automatically refreshes the token if expired but refresh token is valid.
+    """
+    session = await authenticate_request(request, auth_client, verifier)
+    if not session:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return session["user_id"]
 
 
 async def get_optional_user_id(
     request: Request,
-    client: SupabaseClient = Depends(get_supabase_client)
+    auth_client: SupabaseAuthClient = Depends(get_supabase_auth_client),
+    verifier: SupabaseTokenVerifier = Depends(get_token_verifier),
 ) -> str | None:
     """
     Same as get_current_user_id but returns None instead of raising exception.
     Useful for endpoints that work with or without authentication.
     """
     try:
-        return await get_current_user_id(request, client)
+        return await get_current_user_id(request, auth_client, verifier)
     except HTTPException:
         return None
@@ -0,0 +1,56 @@
+"""
+Backfill lesson_plans summary columns for rows saved before they existed.
+
+Usage:
+    python -m app.jobs.backfill_plan_summaries [--batch-size 500]
+
+Safe to re-run: only rows with no summary are touched, and each batch is
+committed on its own. Updated rows get a new updated_at, like any other write.
+"""
+import argparse
+
+from pydantic import ValidationError
+from sqlalchemy import select, update
+
+from app.models.database import LessonPlanDB, get_session
+from app.models.schemas import LessonPlan
+from app.services.plan_summary import compute_plan_summary
+
+
+def backfill(batch_size: int = 500) -> int:
+    """Fill in missing summaries. Returns the number of plans updated."""
+    session = get_session()
+    updated = 0
+    last_id = None
+    try:
+        while True:
+            query = select(LessonPlanDB.id, LessonPlanDB.plan_json).where(LessonPlanDB.segment_count.is_(None))
+            if last_id is not None:
+                query = query.where(LessonPlanDB.id > last_id)
+            rows = session.execute(query.order_by(LessonPlanDB.id).limit(batch_size)).all()
+            if not rows:
+                break
+
+            for plan_id, plan_json in rows:
+                try:
+                    summary = compute_plan_summary(LessonPlan.model_validate(plan_json).model_dump())
+                except ValidationError as e:
+                    print(f"[backfill] Skipping plan {plan_id}: {e.error_count()} validation errors")
+                    continue
+                # Bumps updated_at, so cached copies and ETags of the plan are refreshed
+                session.execute(update(LessonPlanDB).where(LessonPlanDB.id == plan_id).values(summary))
+                updated += 1
+
+            session.commit()
+            last_id = rows[-1].id
+            print(f"[backfill] {updated} plans updated")
+    finally:
+        session.close()
+    return updated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    backfill(args.batch_size)
@@ -1,37 +1,56 @@
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 
-class TokenRefreshMiddleware(BaseHTTPMiddleware):
+class TokenRefreshMiddleware:
     """
     Middleware to set refreshed token cookies on the response.
     Works with the get_current_user_id dependency which stores new tokens in request.state.
+
+    Implemented as plain ASGI (not BaseHTTPMiddleware) so responses, including
+    static files and SSE streams, pass straight through; headers are only
+    touched when tokens were actually refreshed.
     """
 
-    async def dispatch(self, request: Request, call_next):
-        # Initialize state
-        request.state.new_access_token = None
-        request.state.new_refresh_token = None
-        request.state.token_expires_in = None
-
-        response = await call_next(request)
-
-        # If tokens were refreshed during the request, set them in cookies
-        if hasattr(request.state, 'new_access_token') and request.state.new_access_token:
-            response.set_cookie(
-                key="access_token",
-                value=request.state.new_access_token,
-                httponly=True,
-                max_age=request.state.token_expires_in or 3600,
-                samesite="lax"
-            )
-            if request.state.new_refresh_token:
-                response.set_cookie(
-                    key="refresh_token",
-                    value=request.state.new_refresh_token,
-                    httponly=True,
-                    max_age=60 * 60 * 24 * 30,  # 30 days
-                    samesite="lax"
-                )
-
-        return response
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Initialize state (request.state reads and writes this dict)
+        state = scope.setdefault("state", {})
+        state["new_access_token"] = None
+        state["new_refresh_token"] = None
+        state["token_expires_in"] = None
+
+        async def send_with_cookies(message: Message) -> None:
+            # If tokens were refreshed during the request, set them in cookies
+            if message["type"] == "http.response.start" and state.get("new_access_token"):
+                message["headers"] = list(message.get("headers", [])) + _refreshed_cookie_headers(state)
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookies)
+
+
+def _refreshed_cookie_headers(state: dict) -> list[tuple[bytes, bytes]]:
+    """Build Set-Cookie headers for refreshed tokens."""
+    cookies = Response()
+    cookies.set_cookie(
+        key="access_token",
+        value=state["new_access_token"],
+        httponly=True,
+        max_age=state.get("token_expires_in") or 3600,
+        samesite="lax"
+    )
+    if state.get("new_refresh_token"):
+        cookies.set_cookie(
+            key="refresh_token",
+            value=state["new_refresh_token"],
+            httponly=True,
+            max_age=60 * 60 * 24 * 30,  # 30 days
+            samesite="lax"
+        )
+    return [(name, value) for name, value in cookies.raw_headers if name == b"set-cookie"]
@@ -1,24 +1,103 @@
-from datetime import datetime
-from sqlalchemy import Column, String, Integer, Text, DateTime, create_engine
-from sqlalchemy.dialects.postgresql import UUID, JSONB
+from functools import lru_cache
+from sqlalchemy import (
+    CheckConstraint, Column, String, Integer, Float, Text, DateTime, Index, Computed, create_engine, func, text,
+)
+from sqlalchemy.dialects.postgresql import UUID, JSONB, TSVECTOR
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 import uuid
 
 from app.config import get_settings
+from app.models.schemas import MAX_THEME_LENGTH
 
 Base = declarative_base()
 
+# Plan search (see the search_lesson_plans() function added with these columns):
+# ranked full-text over theme, segment and sub-segment names, songs and coaching cues
+PLAN_SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('english'::regconfig, theme), 'A') || "
+    "setweight(jsonb_to_tsvector('english'::regconfig, "
+    "jsonb_path_query_array(plan_json, '$.segments[*].name') || "
+    "jsonb_path_query_array(plan_json, '$.segments[*].sub_segments[*].name') || "
+    "jsonb_path_query_array(plan_json, '$.segments[*].song'), '[\"string\"]'), 'B') || "
+    "setweight(jsonb_to_tsvector('english'::regconfig, "
+    "jsonb_path_query_array(plan_json, '$.segments[*].description') || "
+    "jsonb_path_query_array(plan_json, '$.segments[*].sub_segments[*].description'), '[\"string\"]'), 'C')"
+)
+# ...and trigram (typo-tolerant, partial word) matching over theme, segment names and songs
+PLAN_SEARCH_TEXT_SQL = (
+    "theme || ' ' || "
+    "jsonb_path_query_array(plan_json, '$.segments[*].name')::text || ' ' || "
+    "jsonb_path_query_array(plan_json, '$.segments[*].song')::text"
+)
+
 
 class LessonPlanDB(Base):
     __tablename__ = "lesson_plans"
+    __table_args__ = (
+        # Serves the newest-first plan list (keyset on created_at, id) as an index-only scan
+        Index(
+            "ix_lesson_plans_user_id_created_at",
+            "user_id",
+            text("created_at DESC"),
+            text("id DESC"),
+            postgresql_include=[
+                "theme",
+                "duration_minutes",
+                "updated_at",
+                "segment_count",
+                "linked_track_count",
+                "song_coverage",
+                "avg_bpm",
+                "low_intensity_seconds",
+                "medium_intensity_seconds",
+                "high_intensity_seconds",
+            ],
+        ),
+        # Keeps index tuples under the btree size limit (theme is an INCLUDE column above)
+        CheckConstraint(f"char_length(theme) <= {MAX_THEME_LENGTH}", name="ck_lesson_plans_theme_length"),
+        Index("ix_lesson_plans_search_vector", "search_vector", postgresql_using="gin"),
+        Index(
+            "ix_lesson_plans_search_text_trgm",
+            "search_text",
+            postgresql_using="gin",
+            postgresql_ops={"search_text": "gin_trgm_ops"},
+        ),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(Text, nullable=False, default="default-dev-user", index=True)
+    user_id = Column(Text, nullable=False, default="default-dev-user")
     theme = Column(Text, nullable=False)
     duration_minutes = Column(Integer, nullable=False)
     plan_json = Column(JSONB, nullable=False)
-    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
-    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Summary columns computed from plan_json on every write (see app.services.plan_summary)
+    segment_count = Column(Integer, nullable=True)
+    linked_track_count = Column(Integer, nullable=True)
+    song_coverage = Column(Float, nullable=True)
+    avg_bpm = Column(Float, nullable=True)
+    low_intensity_seconds = Column(Integer, nullable=True)
+    medium_intensity_seconds = Column(Integer, nullable=True)
+    high_intensity_seconds = Column(Integer, nullable=True)
+    # Generated by Postgres; never written or returned by the app
+    search_vector = Column(TSVECTOR, Computed(PLAN_SEARCH_VECTOR_SQL, persisted=True))
+    search_text = Column(Text, Computed(PLAN_SEARCH_TEXT_SQL, persisted=True))
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now())
+
+
+class TrackFeaturesDB(Base):
+    """Cached audio features for a Spotify track (features never change for a track ID)."""
+    __tablename__ = "track_features"
+
+    track_id = Column(Text, primary_key=True)
+    source = Column(Text, nullable=False)  # "spotify" or "getsongbpm"
+    tempo = Column(Float, nullable=True)
+    energy = Column(Float, nullable=True)
+    valence = Column(Float, nullable=True)
+    danceability = Column(Float, nullable=True)
+    features = Column(JSONB, nullable=False)
+    # Last written (store_features also sets it on upsert); GetSongBPM rows expire from it
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
 
 def get_database_url() -> str:
@@ -29,11 +108,47 @@ def get_database_url() -> str:
     return settings.database_url
 
 
+@lru_cache
 def get_engine():
-    return create_engine(get_database_url())
+    """Get the shared synchronous engine (scripts and migrations)."""
+    return create_engine(get_database_url(), pool_pre_ping=True)
+
+
+@lru_cache
+def _get_sessionmaker():
+    return sessionmaker(bind=get_engine())
 
 
 def get_session():
-    engine = get_engine()
-    Session = sessionmaker(bind=engine)
-    return Session()
+    return _get_sessionmaker()()
+
+
+def get_async_database_url() -> str:
+    """Get the PostgreSQL URL for the asyncpg driver."""
+    url = get_database_url()
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+
+def create_async_db_engine() -> AsyncEngine:
+    """Create the pooled async engine (owned by the app lifespan)."""
+    settings = get_settings()
+    connect_args = {}
+    if settings.database_disable_prepared_statements:
+        # Transaction-mode poolers (pgbouncer, Supavisor) can't keep prepared statements across transactions
+        connect_args = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+        }
+    return create_async_engine(
+        get_async_database_url(),
+        pool_size=settings.database_pool_size,
+        max_overflow=settings.database_max_overflow,
+        pool_timeout=settings.database_pool_timeout_seconds,
+        pool_recycle=settings.database_pool_recycle_seconds,
+        pool_pre_ping=True,
+        connect_args=connect_args,
+    )
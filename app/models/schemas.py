@@ -1,6 +1,9 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
 
+# Themes are carried in the plan list index (see LessonPlanDB), so they must stay short
+MAX_THEME_LENGTH = 200
+
 
 class SubSegment(BaseModel):
     """A sub-segment within a song segment for activity changes during continuous playback."""
@@ -30,7 +33,7 @@ class Segment(BaseModel):
 
 class LessonPlan(BaseModel):
     """Complete lesson plan structure."""
-    theme: str
+    theme: str = Field(..., max_length=MAX_THEME_LENGTH)
     total_duration_minutes: int = 0  # Calculated from segments, not provided by AI
     segments: list[Segment]
     notes: str | None = None
@@ -38,7 +41,7 @@ class LessonPlan(BaseModel):
 
 class GenerateRequest(BaseModel):
     """Request to generate a new lesson plan."""
-    theme: str = Field(..., description="Theme or description for the class")
+    theme: str = Field(..., max_length=MAX_THEME_LENGTH, description="Theme or description for the class")
     duration_minutes: int = Field(default=50, ge=15, le=120, description="Class duration in minutes")
 
 
@@ -63,6 +66,12 @@ class SavePlanRequest(BaseModel):
     plan: LessonPlan
 
 
+class ImportPlanLine(BaseModel):
+    """One line of an NDJSON plan import (the export format; other fields are ignored)."""
+    plan: LessonPlan
+    created_at: datetime | None = None
+
+
 class UserInfo(BaseModel):
     """Basic user information."""
     id: str
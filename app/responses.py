@@ -0,0 +1,29 @@
+"""
+Fast JSON responses for plan payloads.
+
+Routes that return a Response directly skip FastAPI's response validation and
+jsonable_encoder pass, so plan endpoints return ORJSONResponse themselves:
+dicts (rows read from the database) are serialized by orjson, and Pydantic
+models in a single model_dump_json pass.
+
+Routers also use it as their default_response_class for everything else.
+"""
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize a Pydantic model or JSON-compatible data (datetimes and UUIDs included) to JSON bytes."""
+    if isinstance(content, BaseModel):
+        return content.model_dump_json().encode()
+    return orjson.dumps(content)
+
+
+class ORJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson (or model_dump_json for Pydantic models)."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,7 +1,10 @@
 from fastapi import APIRouter, HTTPException, Depends, Request, Response
 from pydantic import BaseModel, EmailStr
 
-from app.services.supabase import get_supabase_client, SupabaseClient
+from app.services.supabase import get_supabase_auth_client, SupabaseAuthClient
+from app.services.session_cache import invalidate_session
+from app.services.token_verifier import get_token_verifier, SupabaseTokenVerifier, SigningKeyUnavailable
+from app.dependencies import authenticate_request
 
 router = APIRouter()
 
@@ -32,9 +35,9 @@ class AuthResponse(BaseModel):
 
 
 @router.post("/signup", response_model=AuthResponse)
-async def signup(request: SignupRequest, client: SupabaseClient = Depends(get_supabase_client)):
+async def signup(request: SignupRequest, auth_client: SupabaseAuthClient = Depends(get_supabase_auth_client)):
     try:
-        response = client.auth.sign_up({
+        response = await auth_client.sign_up({
             "email": request.email,
             "password": request.password,
         })
@@ -50,9 +53,9 @@ async def signup(request: SignupRequest, client: SupabaseClient = Depends(get_su
 
 
 @router.post("/login")
-async def login(request: LoginRequest, response: Response, client: SupabaseClient = Depends(get_supabase_client)):
+async def login(request: LoginRequest, response: Response, auth_client: SupabaseAuthClient = Depends(get_supabase_auth_client)):
     try:
-        auth_response = client.auth.sign_in_with_password({
+        auth_response = await auth_client.sign_in_with_password({
             "email": request.email,
             "password": request.password,
         })
@@ -86,7 +89,27 @@ async def login(request: LoginRequest, response: Response, client: SupabaseClien
 
 
 @router.post("/logout")
-async def logout(response: Response):
+async def logout(
+    request: Request,
+    response: Response,
+    auth_client: SupabaseAuthClient = Depends(get_supabase_auth_client),
+    verifier: SupabaseTokenVerifier = Depends(get_token_verifier),
+):
+    access_token = request.cookies.get("access_token")
+    if access_token:
+        invalidate_session(access_token)
+        # Locally verified tokens stay valid until they expire unless revoked here
+        try:
+            claims = await verifier.verify(access_token)
+        except SigningKeyUnavailable:
+            claims = None  # Verified by Supabase, which sees the sign-out below
+        if claims:
+            verifier.revoke(claims)
+        try:
+            # End the session in Supabase too, so its refresh token stops working
+            await auth_client.admin.sign_out(access_token, scope="local")
+        except Exception as e:
+            print(f"[auth] Supabase sign-out failed: {e}")
     response.delete_cookie("access_token")
     response.delete_cookie("refresh_token")
     response.delete_cookie("spotify_access_token")
@@ -95,52 +118,28 @@ async def logout(response: Response):
 
 
 @router.get("/me")
-async def get_current_user(request: Request, client: SupabaseClient = Depends(get_supabase_client)):
+async def get_current_user(
+    request: Request,
+    auth_client: SupabaseAuthClient = Depends(get_supabase_auth_client),
+    verifier: SupabaseTokenVerifier = Depends(get_token_verifier),
+):
     """Get current logged-in user info. Automatically refreshes expired tokens."""
-    access_token = request.cookies.get("access_token")
-    refresh_token = request.cookies.get("refresh_token")
-
-    if not access_token and not refresh_token:
+    session = await authenticate_request(request, auth_client, verifier)
+    if not session:
         return {"authenticated": False}
 
-    # Try with existing access token first
-    if access_token:
-        try:
-            user_response = client.auth.get_user(access_token)
-            if user_response and user_response.user:
-                return {
-                    "authenticated": True,
-                    "user_id": user_response.user.id,
-                    "email": user_response.user.email,
-                }
-        except Exception:
-            pass  # Token expired, try refresh below
-
-    # Try to refresh the token
-    if refresh_token:
-        try:
-            new_session = client.auth.refresh_session(refresh_token)
-            if new_session and new_session.session and new_session.user:
-                # Store new tokens in request state for middleware to set cookies
-                request.state.new_access_token = new_session.session.access_token
-                request.state.new_refresh_token = new_session.session.refresh_token
-                request.state.token_expires_in = new_session.session.expires_in
-                return {
-                    "authenticated": True,
-                    "user_id": new_session.user.id,
-                    "email": new_session.user.email,
-                }
-        except Exception:
-            pass  # Refresh token also invalid
-
-    return {"authenticated": False}
+    return {
+        "authenticated": True,
+        "user_id": session["user_id"],
+        "email": session["email"],
+    }
 
 
 @router.post("/forgot-password")
-async def forgot_password(request: ForgotPasswordRequest, client: SupabaseClient = Depends(get_supabase_client)):
+async def forgot_password(request: ForgotPasswordRequest, auth_client: SupabaseAuthClient = Depends(get_supabase_auth_client)):
     """Send a password reset email."""
     try:
-        client.auth.reset_password_email(request.email)
+        await auth_client.reset_password_email(request.email)
         return {"message": "Password reset email sent"}
     except Exception as e:
         # Don't reveal if email exists or not for security
@@ -148,12 +147,13 @@ async def forgot_password(request: ForgotPasswordRequest, client: SupabaseClient
 
 
 @router.post("/reset-password")
-async def reset_password(request: ResetPasswordRequest, client: SupabaseClient = Depends(get_supabase_client)):
+async def reset_password(request: ResetPasswordRequest, auth_client: SupabaseAuthClient = Depends(get_supabase_auth_client)):
     """Reset password using the token from email."""
     try:
         # Use the access token to update the user's password
-        client.auth.admin.update_user_by_id(
-            client.auth.get_user(request.access_token).user.id,
+        user_response = await auth_client.get_user(request.access_token)
+        await auth_client.admin.update_user_by_id(
+            user_response.user.id,
             {"password": request.password}
         )
         return {"message": "Password reset successfully"}
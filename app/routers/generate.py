@@ -1,16 +1,30 @@
+import asyncio
 import uuid
+from datetime import datetime, timezone
+import httpx
+from collections.abc import AsyncIterator
+from anthropic import AsyncAnthropic
 from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
-from app.models.schemas import GenerateRequest, GenerateResponse, LessonPlan
-from app.services.ai import generate_lesson_plan
+from app.models.schemas import GenerateRequest, GenerateResponse, LessonPlan, Segment
+from app.services.ai import stream_lesson_plan, get_anthropic_client
 from app.services.supabase import get_supabase_client, SupabaseClient
-from app.services.spotify import search_tracks, get_audio_features
+from app.services.plan_writer import get_plan_writer, PlanWriteQueue
+from app.services.plan_summary import plan_json_columns
+from app.services.spotify import search_tracks, get_spotify_http_client
+from app.services.spotify_rate_limit import spotify_http_exception
+from app.services.track_features import get_audio_features_batch_cached
 from app.services.playlist_to_plan import playlist_to_plan
 from app.services.rate_limiter import check_rate_limit, record_request, get_remaining_requests
 from app.dependencies import get_current_user_id
+from app.responses import ORJSONResponse, dumps
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
+
+# Max concurrent Spotify searches per plan being linked
+SPOTIFY_SEARCH_CONCURRENCY = 5
 
 
 class GenerateResponseWithId(GenerateResponse):
@@ -35,53 +49,182 @@ def tempo_to_bpm_range(tempo: float) -> str:
     return f"{base - 5}-{base + 5}"
 
 
-async def auto_link_spotify_uris(plan: LessonPlan, spotify_token: str | None) -> LessonPlan:
-    """Search Spotify for AI-suggested songs and add URIs, durations, and audio features."""
-    if not spotify_token:
-        return plan
+async def _search_segment_track(
+    http_client: httpx.AsyncClient,
+    segment: Segment,
+    spotify_token: str,
+    semaphore: asyncio.Semaphore,
+) -> str | None:
+    """
+    Search Spotify for a segment's suggested song and add its URI and duration.
 
-    total_duration_seconds = 0
+    Returns the matched track ID so audio features can be fetched in one batch.
+    """
+    if not segment.song or segment.spotify_uri:
+        return None
 
-    for segment in plan.segments:
-        if segment.song and not segment.spotify_uri:
-            try:
-                # Search Spotify for the song
-                results = await search_tracks(segment.song, spotify_token, limit=1)
-                tracks = results.get("tracks", {}).get("items", [])
-                if tracks:
-                    track = tracks[0]
-                    track_id = track["id"]
-                    segment.spotify_uri = track["uri"]
+    try:
+        # Search Spotify for the song
+        async with semaphore:
+            results = await search_tracks(http_client, segment.song, spotify_token, limit=1)
+        tracks = results.get("tracks", {}).get("items", [])
+        if not tracks:
+            return None
 
-                    # Update song name with actual track info for accuracy
-                    artist = track["artists"][0]["name"] if track["artists"] else ""
-                    segment.song = f"{track['name']} - {artist}"
+        track = tracks[0]
+        segment.spotify_uri = track["uri"]
 
-                    # Update segment duration to match actual song duration
-                    if track.get("duration_ms"):
-                        segment.duration_seconds = track["duration_ms"] // 1000
+        # Update song name with actual track info for accuracy
+        artist = track["artists"][0]["name"] if track["artists"] else ""
+        segment.song = f"{track['name']} - {artist}"
 
-                    # Get audio features to set intensity and BPM based on actual song
-                    audio_features = await get_audio_features(track_id, spotify_token)
-                    if audio_features:
-                        # Set intensity based on energy level
-                        if audio_features.get("energy") is not None:
-                            segment.intensity = energy_to_intensity(audio_features["energy"])
+        # Update segment duration to match actual song duration
+        if track.get("duration_ms"):
+            segment.duration_seconds = track["duration_ms"] // 1000
 
-                        # Set BPM range based on actual tempo
-                        if audio_features.get("tempo"):
-                            segment.suggested_bpm_range = tempo_to_bpm_range(audio_features["tempo"])
+        return track["id"]
+    except Exception as e:
+        # Log but don't fail - song will just not have URI
+        print(f"Warning: Failed to search Spotify for '{segment.song}': {e}")
+        return None
+
+
+async def _apply_audio_features(
+    client: SupabaseClient,
+    http_client: httpx.AsyncClient,
+    segments: list[Segment],
+    track_ids: list[str | None],
+    spotify_token: str,
+) -> None:
+    """Fetch audio features for all matched tracks in one batch and set intensity and BPM from them."""
+    unique_ids = list(dict.fromkeys(track_id for track_id in track_ids if track_id))
+    if not unique_ids:
+        return
+
+    audio_features_map, _ = await get_audio_features_batch_cached(client, http_client, unique_ids, spotify_token)
+
+    for segment, track_id in zip(segments, track_ids):
+        audio_features = audio_features_map.get(track_id) if track_id else None
+        if not audio_features:
+            continue
+
+        # Set intensity based on energy level
+        if audio_features.get("energy") is not None:
+            segment.intensity = energy_to_intensity(audio_features["energy"])
+
+        # Set BPM range based on actual tempo
+        if audio_features.get("tempo"):
+            segment.suggested_bpm_range = tempo_to_bpm_range(audio_features["tempo"])
+
+
+def _update_total_duration(plan: LessonPlan) -> None:
+    total_seconds = sum(seg.duration_seconds for seg in plan.segments)
+    plan.total_duration_minutes = (total_seconds + 59) // 60  # Round up
+
+
+async def auto_link_spotify_uris(
+    client: SupabaseClient,
+    http_client: httpx.AsyncClient,
+    plan: LessonPlan,
+    spotify_token: str | None,
+) -> LessonPlan:
+    """Search Spotify for AI-suggested songs and add URIs, durations, and audio features."""
+    if not spotify_token:
+        return plan
 
-            except Exception as e:
-                # Log but don't fail - song will just not have URI
-                print(f"Warning: Failed to search Spotify for '{segment.song}': {e}")
+    semaphore = asyncio.Semaphore(SPOTIFY_SEARCH_CONCURRENCY)
+    track_ids = await asyncio.gather(
+        *(_search_segment_track(http_client, segment, spotify_token, semaphore) for segment in plan.segments)
+    )
+    await _apply_audio_features(client, http_client, plan.segments, track_ids, spotify_token)
 
-        total_duration_seconds += segment.duration_seconds
+    _update_total_duration(plan)
+    return plan
 
-    # Update total plan duration
-    plan.total_duration_minutes = (total_duration_seconds + 59) // 60  # Round up
 
-    return plan
+async def generate_linked_plan(
+    anthropic_client: AsyncAnthropic,
+    client: SupabaseClient,
+    spotify_http_client: httpx.AsyncClient,
+    theme: str,
+    duration_minutes: int,
+    spotify_token: str | None,
+) -> AsyncIterator[tuple[str, str | Segment | LessonPlan]]:
+    """
+    Generate a plan and link its songs to Spotify while the model is still writing.
+
+    Each segment's Spotify search starts as soon as the segment is streamed, so
+    linking overlaps with generation; audio features for all matched tracks are
+    then fetched in one batch. Yields ("text", chunk), ("segment", Segment)
+    and ("progress", stage) events, then a single ("plan", LessonPlan).
+    """
+    semaphore = asyncio.Semaphore(SPOTIFY_SEARCH_CONCURRENCY)
+    # (segment as streamed, copy being linked, search task)
+    searches: list[tuple[Segment, Segment, asyncio.Task]] = []
+    try:
+        plan = None
+        async for kind, data in stream_lesson_plan(anthropic_client, theme, duration_minutes):
+            if kind == "segment":
+                if spotify_token:
+                    # Link a copy so the streamed segment can be compared with the final parse
+                    linked = data.model_copy()
+                    task = asyncio.create_task(
+                        _search_segment_track(spotify_http_client, linked, spotify_token, semaphore)
+                    )
+                    searches.append((data, linked, task))
+                yield kind, data
+            elif kind == "text":
+                yield kind, data
+            else:
+                plan = data
+
+        if spotify_token:
+            yield "progress", "linking"
+            pending = []
+            for i, segment in enumerate(plan.segments):
+                if i < len(searches) and searches[i][0] == segment:
+                    plan.segments[i] = searches[i][1]
+                    pending.append(searches[i][2])
+                else:
+                    # Streamed segments didn't line up with the final parse; search for it now
+                    pending.append(_search_segment_track(spotify_http_client, segment, spotify_token, semaphore))
+            track_ids = await asyncio.gather(*pending)
+            await _apply_audio_features(client, spotify_http_client, plan.segments, track_ids, spotify_token)
+
+        _update_total_duration(plan)
+        yield "plan", plan
+    finally:
+        for _, _, task in searches:
+            task.cancel()
+
+
+async def _save_generated_plan(plan_writer: PlanWriteQueue, user_id: str, plan_json: dict) -> str | None:
+    """
+    Auto-save a generated plan (already dumped, so the response can reuse it)
+    in the background. Returns the new plan ID, or None if the save couldn't be queued.
+    """
+    try:
+        plan_id = str(uuid.uuid4())
+        now = datetime.now(timezone.utc).isoformat()
+        data = {
+            "id": plan_id,
+            "user_id": user_id,
+            **plan_json_columns(plan_json),
+            # Set here so the queued row is complete (see GET /api/plans/{id})
+            "created_at": now,
+            "updated_at": now,
+        }
+        await plan_writer.enqueue(data)
+        return plan_id
+    except Exception as save_error:
+        # Log but don't fail if save fails
+        print(f"Warning: Failed to auto-save plan: {save_error}")
+        return None
+
+
+def _sse_event(event: str, data: dict | BaseModel) -> str:
+    """Format a Server-Sent Event."""
+    return f"event: {event}\ndata: {dumps(data).decode()}\n\n"
 
 
 @router.post("/generate", response_model=GenerateResponseWithId)
@@ -90,52 +233,111 @@ async def generate(
     http_request: Request,
     user_id: str = Depends(get_current_user_id),
     client: SupabaseClient = Depends(get_supabase_client),
+    plan_writer: PlanWriteQueue = Depends(get_plan_writer),
+    anthropic_client: AsyncAnthropic = Depends(get_anthropic_client),
+    spotify_http_client: httpx.AsyncClient = Depends(get_spotify_http_client),
 ):
     """Generate a cycle class lesson plan using AI and save it."""
     # Check rate limit before doing any work
     check_rate_limit(user_id)
 
     try:
-        plan = await generate_lesson_plan(
+        # Auto-link Spotify URIs if user is connected to Spotify
+        spotify_token = http_request.cookies.get("spotify_access_token")
+
+        plan = None
+        async for kind, data in generate_linked_plan(
+            anthropic_client,
+            client,
+            spotify_http_client,
             theme=request.theme,
             duration_minutes=request.duration_minutes,
-        )
-
-        # Calculate total duration from segments
-        total_seconds = sum(seg.duration_seconds for seg in plan.segments)
-        plan.total_duration_minutes = (total_seconds + 59) // 60  # Round up
+            spotify_token=spotify_token,
+        ):
+            if kind == "plan":
+                plan = data
 
         # Record successful generation for rate limiting
         record_request(user_id)
 
-        # Auto-link Spotify URIs if user is connected to Spotify
-        spotify_token = http_request.cookies.get("spotify_access_token")
-        plan = await auto_link_spotify_uris(plan, spotify_token)
+        # Dump the plan once for both the save and the response
+        plan_json = plan.model_dump()
 
         # Auto-save the generated plan
-        plan_id = None
-        try:
-            plan_id = str(uuid.uuid4())
-            data = {
-                "id": plan_id,
-                "user_id": user_id,
-                "theme": plan.theme,
-                "duration_minutes": plan.total_duration_minutes,
-                "plan_json": plan.model_dump(),
-            }
-            client.table("lesson_plans").insert(data).execute()
-        except Exception as save_error:
-            # Log but don't fail if save fails
-            print(f"Warning: Failed to auto-save plan: {save_error}")
-            plan_id = None
-
-        return GenerateResponseWithId(plan=plan, id=plan_id)
+        plan_id = await _save_generated_plan(plan_writer, user_id, plan_json)
+
+        return ORJSONResponse({"plan": plan_json, "id": plan_id})
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Generation failed: {str(e)}")
 
 
+@router.post("/generate/stream")
+async def generate_stream(
+    request: GenerateRequest,
+    http_request: Request,
+    user_id: str = Depends(get_current_user_id),
+    client: SupabaseClient = Depends(get_supabase_client),
+    plan_writer: PlanWriteQueue = Depends(get_plan_writer),
+    anthropic_client: AsyncAnthropic = Depends(get_anthropic_client),
+    spotify_http_client: httpx.AsyncClient = Depends(get_spotify_http_client),
+):
+    """
+    Generate and save a lesson plan, streaming progress as Server-Sent Events.
+
+    Events:
+        progress: {"stage": "generating" | "linking" | "saving"}
+        delta: {"text": "..."} partial model output as it is written
+        segment: {...} each segment as soon as the model finishes writing it
+        plan: {"plan": {...}, "id": "..."} the final saved plan
+        error: {"detail": "..."}
+    """
+    # Check rate limit before doing any work
+    check_rate_limit(user_id)
+
+    spotify_token = http_request.cookies.get("spotify_access_token")
+
+    async def event_stream():
+        try:
+            yield _sse_event("progress", {"stage": "generating"})
+
+            plan = None
+            async for kind, data in generate_linked_plan(
+                anthropic_client,
+                client,
+                spotify_http_client,
+                theme=request.theme,
+                duration_minutes=request.duration_minutes,
+                spotify_token=spotify_token,
+            ):
+                if kind == "text":
+                    yield _sse_event("delta", {"text": data})
+                elif kind == "segment":
+                    yield _sse_event("segment", data)
+                elif kind == "progress":
+                    yield _sse_event("progress", {"stage": data})
+                else:
+                    plan = data
+
+            # Record successful generation for rate limiting
+            record_request(user_id)
+
+            yield _sse_event("progress", {"stage": "saving"})
+            plan_json = plan.model_dump()
+            plan_id = await _save_generated_plan(plan_writer, user_id, plan_json)
+
+            yield _sse_event("plan", {"plan": plan_json, "id": plan_id})
+        except Exception as e:
+            yield _sse_event("error", {"detail": f"Generation failed: {str(e)}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/rate-limit")
 async def get_rate_limit_status(
     user_id: str = Depends(get_current_user_id),
@@ -155,6 +357,8 @@ async def generate_from_playlist(
     body: FromPlaylistRequest,
     user_id: str = Depends(get_current_user_id),
     client: SupabaseClient = Depends(get_supabase_client),
+    plan_writer: PlanWriteQueue = Depends(get_plan_writer),
+    spotify_http_client: httpx.AsyncClient = Depends(get_spotify_http_client),
 ):
     """Create a lesson plan from a Spotify playlist."""
     spotify_token = request.cookies.get("spotify_access_token")
@@ -165,25 +369,22 @@ async def generate_from_playlist(
     try:
         # Convert playlist to plan
         plan = await playlist_to_plan(
+            client,
+            spotify_http_client,
             access_token=spotify_token,
             playlist_id=body.playlist_id,
             playlist_name=body.playlist_name,
         )
 
+        # Dump the plan once for both the save and the response
+        plan_json = plan.model_dump()
+
         # Auto-save the plan
-        plan_id = str(uuid.uuid4())
-        data = {
-            "id": plan_id,
-            "user_id": user_id,
-            "theme": plan.theme,
-            "duration_minutes": plan.total_duration_minutes,
-            "plan_json": plan.model_dump(),
-        }
-        client.table("lesson_plans").insert(data).execute()
+        plan_id = await _save_generated_plan(plan_writer, user_id, plan_json)
 
-        return GenerateResponseWithId(plan=plan, id=plan_id)
+        return ORJSONResponse({"plan": plan_json, "id": plan_id})
 
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to create plan from playlist: {str(e)}")
+        raise spotify_http_exception(e, 500, "Failed to create plan from playlist")
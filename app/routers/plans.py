@@ -1,31 +1,114 @@
 import uuid
-from fastapi import APIRouter, HTTPException, Depends, Request
+from collections.abc import AsyncIterator
+from datetime import datetime, timezone
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 
-from app.models.schemas import SavedPlan, SavePlanRequest, LessonPlan
-from app.services.supabase import get_supabase_client, SupabaseClient
+from app.models.schemas import SavedPlan, SavePlanRequest, ImportPlanLine, LessonPlan, Segment
+from app.responses import ORJSONResponse, dumps
+from app.services.json_patch import apply_patch, JsonPatchError, MalformedPatch, PatchOperation
+from app.services.plan_repository import (
+    get_plan_repository, PlanRepository, decode_cursor, encode_cursor, decode_search_cursor, encode_search_cursor,
+    InvalidCursor,
+)
+from app.services.plan_cache import cache_plan, etag_matches, get_cached_plan, invalidate_plan, plan_etag
+from app.services.plan_summary import plan_columns, plan_json_columns
+from app.services.plan_writer import get_plan_writer, PlanWriteQueue
 from app.dependencies import get_current_user_id
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Plans change, so browsers may keep them but must revalidate (cheap, thanks to the ETag)
+PLAN_CACHE_CONTROL = "private, no-cache"
+
+MAX_PATCH_OPERATIONS = 200
+
+MAX_SEARCH_QUERY_LENGTH = 200
+
+# Plans fetched per round trip while exporting
+EXPORT_BATCH_SIZE = 100
+# Export lines are sent in chunks of about this size
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+# Plans inserted per statement while importing
+IMPORT_BATCH_SIZE = 100
+# Longer import lines are rejected without being parsed
+MAX_IMPORT_LINE_BYTES = 1024 * 1024
+MAX_REPORTED_IMPORT_ERRORS = 100
 
 
 @router.get("")
 async def list_plans(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
     user_id: str = Depends(get_current_user_id),
-    client: SupabaseClient = Depends(get_supabase_client),
+    plans: PlanRepository = Depends(get_plan_repository),
 ):
-    """List all lesson plans for the current user."""
+    """
+    List the current user's lesson plans, newest first.
+
+    Returns summaries only (fetch a plan by ID for its segments). Pass the
+    returned next_cursor to get the next page; it is None on the last page.
+    """
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     try:
-        response = client.table("lesson_plans").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
-        return {"plans": response.data}
+        # Fetch one extra row to know whether there is another page
+        rows = await plans.list_plans(user_id, limit + 1, after)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    page = rows[:limit]
+    next_cursor = encode_cursor(page[-1]) if len(rows) > limit else None
+    return ORJSONResponse({"plans": page, "next_cursor": next_cursor})
+
+
+@router.get("/search")
+async def search_plans(
+    q: str = Query(..., min_length=1, max_length=MAX_SEARCH_QUERY_LENGTH),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    user_id: str = Depends(get_current_user_id),
+    plans: PlanRepository = Depends(get_plan_repository),
+):
+    """
+    Search the current user's lesson plans by theme, segment names, coaching cues and songs.
+
+    Supports web-search syntax ("quoted phrases", -excluded, or) and tolerates
+    typos in themes, segment names and songs. Returns summaries, best match
+    first, paginated like the plan list.
+    """
+    query = q.strip()
+    if not query:
+        raise HTTPException(status_code=422, detail="Search query is empty")
+    try:
+        after = decode_search_cursor(cursor) if cursor else None
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        # Fetch one extra row to know whether there is another page
+        rows = await plans.search_plans(user_id, query, limit + 1, after)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    page = rows[:limit]
+    next_cursor = encode_search_cursor(page[-1]) if len(rows) > limit else None
+    return ORJSONResponse({"plans": page, "next_cursor": next_cursor})
+
 
 @router.post("")
 async def save_plan(
     request: SavePlanRequest,
     user_id: str = Depends(get_current_user_id),
-    client: SupabaseClient = Depends(get_supabase_client),
+    plans: PlanRepository = Depends(get_plan_repository),
 ):
     """Save a lesson plan."""
     try:
@@ -33,28 +116,212 @@ async def save_plan(
         data = {
             "id": plan_id,
             "user_id": user_id,
-            "theme": request.plan.theme,
-            "duration_minutes": request.plan.total_duration_minutes,
-            "plan_json": request.plan.model_dump(),
+            **plan_columns(request.plan),
         }
-        response = client.table("lesson_plans").insert(data).execute()
+        await plans.insert_plan(data)
         return {"id": plan_id, "message": "Plan saved successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _export_line(plan: dict) -> bytes:
+    return dumps({
+        "id": plan["id"],
+        "theme": plan["theme"],
+        "duration_minutes": plan["duration_minutes"],
+        "created_at": plan["created_at"],
+        "updated_at": plan["updated_at"],
+        "plan": plan["plan_json"],
+    }) + b"\n"
+
+
+async def _export_plans(plans: PlanRepository, user_id: str) -> AsyncIterator[bytes]:
+    chunk = []
+    chunk_size = 0
+    try:
+        async for plan in plans.iter_plans(user_id, EXPORT_BATCH_SIZE):
+            line = _export_line(plan)
+            chunk.append(line)
+            chunk_size += len(line)
+            if chunk_size >= EXPORT_CHUNK_BYTES:
+                yield b"".join(chunk)
+                chunk = []
+                chunk_size = 0
+    except Exception as e:
+        # Headers are already sent; end with an error line so the export isn't silently truncated
+        print(f"[plans] Export failed for user {user_id}: {e}")
+        chunk.append(dumps({"error": "Export failed"}) + b"\n")
+    if chunk:
+        yield b"".join(chunk)
+
+
+@router.get("/export")
+async def export_plans(
+    user_id: str = Depends(get_current_user_id),
+    plans: PlanRepository = Depends(get_plan_repository),
+):
+    """
+    Export all of the current user's lesson plans as NDJSON, one plan per line, newest first.
+
+    The export is streamed, so it works for libraries of any size. If it fails
+    part way, the last line is {"error": ...}.
+    """
+    return StreamingResponse(
+        _export_plans(plans, user_id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="plans.ndjson"'},
+    )
+
+
+async def _read_lines(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[tuple[int, bytes | None]]:
+    """Split a streamed body into numbered lines. A line longer than max_line_bytes is yielded as None."""
+    buffer = b""
+    line_number = 0
+    skipping = False
+    async for chunk in chunks:
+        *lines, buffer = (buffer + chunk).split(b"\n")
+        for line in lines:
+            if skipping:
+                # The end of an over-long line, already reported
+                skipping = False
+                continue
+            line_number += 1
+            yield line_number, line if len(line) <= max_line_bytes else None
+        if skipping:
+            buffer = b""
+        elif len(buffer) > max_line_bytes:
+            line_number += 1
+            yield line_number, None
+            skipping = True
+            buffer = b""
+    if buffer and not skipping:
+        line_number += 1
+        yield line_number, buffer
+
+
+def _validation_message(error: ValidationError) -> str:
+    """One-line summary of a validation error, e.g. "plan.theme: Field required"."""
+    messages = []
+    for item in error.errors(include_url=False, include_context=False, include_input=False):
+        location = ".".join(str(part) for part in item["loc"])
+        messages.append(f"{location}: {item['msg']}" if location else item["msg"])
+    return "; ".join(messages)
+
+
+async def _insert_import_batch(plans: PlanRepository, batch: list[tuple[int, dict]]) -> list[dict]:
+    """Insert a batch of imported plans; returns errors for the lines that couldn't be saved."""
+    try:
+        await plans.insert_plans([row for _, row in batch])
+        return []
+    except Exception:
+        pass
+
+    # Find the rows that can't be written, write the rest
+    errors = []
+    for line_number, row in batch:
+        try:
+            await plans.insert_plans([row])
+        except Exception as e:
+            errors.append({"line": line_number, "error": f"Failed to save plan: {e}"})
+    return errors
+
+
+@router.post("/import")
+async def import_plans(
+    request: Request,
+    user_id: str = Depends(get_current_user_id),
+    plans: PlanRepository = Depends(get_plan_repository),
+):
+    """
+    Import lesson plans from an NDJSON body (the export format), one plan per line.
+
+    Each line is validated on its own; invalid lines are reported and skipped,
+    the rest are saved as new plans (new IDs; created_at is kept if present).
+    Returns the number imported and failed, with the first errors by line number.
+    """
+    imported = 0
+    line_errors = []
+    failed = 0
+    batch = []
+
+    async for line_number, line in _read_lines(request.stream(), MAX_IMPORT_LINE_BYTES):
+        if line is None:
+            line_errors.append({"line": line_number, "error": f"Line longer than {MAX_IMPORT_LINE_BYTES} bytes"})
+        elif line.strip():
+            try:
+                item = ImportPlanLine.model_validate_json(line)
+                created_at = item.created_at or datetime.now(timezone.utc)
+                batch.append((line_number, {
+                    "id": str(uuid.uuid4()),
+                    "user_id": user_id,
+                    **plan_columns(item.plan),
+                    "created_at": created_at.isoformat(),
+                }))
+            except ValidationError as e:
+                line_errors.append({"line": line_number, "error": f"Invalid plan: {_validation_message(e)}"})
+
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            insert_errors = await _insert_import_batch(plans, batch)
+            imported += len(batch) - len(insert_errors)
+            line_errors.extend(insert_errors)
+            batch = []
+
+        # Count every error, but only keep the first few
+        if len(line_errors) > MAX_REPORTED_IMPORT_ERRORS:
+            failed += len(line_errors) - MAX_REPORTED_IMPORT_ERRORS
+            line_errors.sort(key=lambda error: error["line"])
+            del line_errors[MAX_REPORTED_IMPORT_ERRORS:]
+
+    if batch:
+        insert_errors = await _insert_import_batch(plans, batch)
+        imported += len(batch) - len(insert_errors)
+        line_errors.extend(insert_errors)
+
+    failed += len(line_errors)
+    line_errors.sort(key=lambda error: error["line"])
+    return {"imported": imported, "failed": failed, "errors": line_errors[:MAX_REPORTED_IMPORT_ERRORS]}
+
+
 @router.get("/{plan_id}")
 async def get_plan(
     plan_id: str,
+    request: Request,
     user_id: str = Depends(get_current_user_id),
-    client: SupabaseClient = Depends(get_supabase_client),
+    plans: PlanRepository = Depends(get_plan_repository),
+    plan_writer: PlanWriteQueue = Depends(get_plan_writer),
 ):
-    """Get a specific lesson plan."""
+    """
+    Get a specific lesson plan.
+
+    Responses carry an ETag; a matching If-None-Match gets a 304 without the
+    plan being loaded. Browsers revalidate on every fetch (Cache-Control: no-cache).
+    """
+    # Auto-saved plans may not be written yet
+    pending = plan_writer.get_pending(user_id, plan_id)
+    if pending:
+        etag = plan_etag(plan_id, pending["updated_at"])
+        return ORJSONResponse(pending, headers={"ETag": etag, "Cache-Control": "no-store"})
+
     try:
-        response = client.table("lesson_plans").select("*").eq("id", plan_id).eq("user_id", user_id).single().execute()
-        if not response.data:
+        # Check the plan's version first; the full plan only loads on a cache miss
+        updated_at = await plans.get_plan_updated_at(user_id, plan_id)
+        if not updated_at:
             raise HTTPException(status_code=404, detail="Plan not found")
-        return response.data
+
+        etag = plan_etag(plan_id, updated_at)
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": PLAN_CACHE_CONTROL})
+
+        plan = get_cached_plan(user_id, plan_id, updated_at)
+        if plan is None:
+            plan = await plans.get_plan(user_id, plan_id)
+            if not plan:
+                raise HTTPException(status_code=404, detail="Plan not found")
+            cache_plan(user_id, plan)
+
+        # The plan may have changed since the version check
+        etag = plan_etag(plan_id, plan["updated_at"])
+        return ORJSONResponse(plan, headers={"ETag": etag, "Cache-Control": PLAN_CACHE_CONTROL})
     except HTTPException:
         raise
     except Exception as e:
@@ -65,20 +332,127 @@ async def get_plan(
 async def update_plan(
     plan_id: str,
     request: SavePlanRequest,
+    http_request: Request,
     user_id: str = Depends(get_current_user_id),
-    client: SupabaseClient = Depends(get_supabase_client),
+    plans: PlanRepository = Depends(get_plan_repository),
+    plan_writer: PlanWriteQueue = Depends(get_plan_writer),
 ):
-    """Update an existing lesson plan."""
+    """
+    Update an existing lesson plan.
+
+    With an If-Match header (the ETag the plan was read with), the plan is only
+    replaced if it hasn't been saved since; otherwise 412 is returned.
+    """
     try:
-        data = {
-            "theme": request.plan.theme,
-            "duration_minutes": request.plan.total_duration_minutes,
-            "plan_json": request.plan.model_dump(),
-        }
-        response = client.table("lesson_plans").update(data).eq("id", plan_id).eq("user_id", user_id).execute()
-        if not response.data:
+        # A plan opened straight after generation may not be written yet
+        await plan_writer.flush(user_id, plan_id)
+        invalidate_plan(user_id, plan_id)
+        expected_updated_at = None
+        if_match = http_request.headers.get("if-match")
+        if if_match:
+            expected_updated_at = await plans.get_plan_updated_at(user_id, plan_id)
+            if not expected_updated_at:
+                raise HTTPException(status_code=404, detail="Plan not found")
+            if not etag_matches(if_match, plan_etag(plan_id, expected_updated_at), weak=False):
+                raise HTTPException(status_code=412, detail="Plan has been changed since it was loaded")
+
+        updated_at = await plans.update_plan(
+            user_id, plan_id, plan_columns(request.plan), expected_updated_at=expected_updated_at
+        )
+        if not updated_at:
+            if expected_updated_at:
+                raise HTTPException(status_code=412, detail="Plan has been changed since it was loaded")
+            raise HTTPException(status_code=404, detail="Plan not found")
+        return ORJSONResponse(
+            {"id": plan_id, "message": "Plan updated successfully", "updated_at": updated_at},
+            headers={"ETag": plan_etag(plan_id, updated_at)},
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _patch_plan_json(plan_json: dict, operations: list[PatchOperation]) -> dict:
+    """
+    Apply a JSON Patch to a stored plan document and validate the result.
+
+    Segments the patch didn't touch are still the stored (already valid)
+    objects, so only new or changed segments go through Pydantic.
+    """
+    patched = apply_patch(plan_json, operations)
+    if not isinstance(patched, dict) or not isinstance(patched.get("segments"), list):
+        raise JsonPatchError("A plan must be an object with a segments array")
+
+    unchanged = {id(segment) for segment in plan_json.get("segments", [])}
+    segments = [
+        segment if id(segment) in unchanged else Segment.model_validate(segment).model_dump()
+        for segment in patched["segments"]
+    ]
+
+    # Everything except the segments is a few scalar fields
+    plan = LessonPlan.model_validate({**patched, "segments": []}).model_dump(exclude={"segments"})
+    total_seconds = sum(segment["duration_seconds"] for segment in segments)
+    plan["total_duration_minutes"] = (total_seconds + 59) // 60  # Round up
+    return {**plan, "segments": segments}
+
+
+@router.patch("/{plan_id}")
+async def patch_plan(
+    plan_id: str,
+    operations: list[PatchOperation],
+    request: Request,
+    user_id: str = Depends(get_current_user_id),
+    plans: PlanRepository = Depends(get_plan_repository),
+    plan_writer: PlanWriteQueue = Depends(get_plan_writer),
+):
+    """
+    Partially update a lesson plan with RFC 6902 JSON Patch operations on its plan_json.
+
+    Requires an If-Match header with the ETag the plan was read with; if the plan
+    has been saved since, nothing is applied and 412 is returned. The response
+    carries the new ETag for the next patch.
+    """
+    if len(operations) > MAX_PATCH_OPERATIONS:
+        raise HTTPException(status_code=422, detail=f"At most {MAX_PATCH_OPERATIONS} operations per patch")
+    if_match = request.headers.get("if-match")
+    if not if_match:
+        raise HTTPException(status_code=428, detail="If-Match header required")
+
+    try:
+        # A plan opened straight after generation may not be written yet
+        await plan_writer.flush(user_id, plan_id)
+        updated_at = await plans.get_plan_updated_at(user_id, plan_id)
+        if not updated_at:
             raise HTTPException(status_code=404, detail="Plan not found")
-        return {"id": plan_id, "message": "Plan updated successfully"}
+        if not etag_matches(if_match, plan_etag(plan_id, updated_at), weak=False):
+            raise HTTPException(status_code=412, detail="Plan has been changed since it was loaded")
+
+        current = get_cached_plan(user_id, plan_id, updated_at) or await plans.get_plan(user_id, plan_id)
+        if not current or current["updated_at"] != updated_at:
+            raise HTTPException(status_code=412, detail="Plan has been changed since it was loaded")
+
+        try:
+            plan_json = _patch_plan_json(current["plan_json"], operations)
+        except MalformedPatch as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except JsonPatchError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+
+        # Only written if nobody else saved the plan in the meantime
+        data = plan_json_columns(plan_json)
+        new_updated_at = await plans.update_plan(user_id, plan_id, data, expected_updated_at=updated_at)
+        if not new_updated_at:
+            invalidate_plan(user_id, plan_id)
+            raise HTTPException(status_code=412, detail="Plan has been changed since it was loaded")
+
+        cache_plan(user_id, {**current, **data, "updated_at": new_updated_at})
+        return ORJSONResponse(
+            {"id": plan_id, "message": "Plan updated successfully", "updated_at": new_updated_at},
+            headers={"ETag": plan_etag(plan_id, new_updated_at)},
+        )
     except HTTPException:
         raise
     except Exception as e:
@@ -89,11 +463,15 @@ async def update_plan(
 async def delete_plan(
     plan_id: str,
     user_id: str = Depends(get_current_user_id),
-    client: SupabaseClient = Depends(get_supabase_client),
+    plans: PlanRepository = Depends(get_plan_repository),
+    plan_writer: PlanWriteQueue = Depends(get_plan_writer),
 ):
     """Delete a lesson plan."""
     try:
-        response = client.table("lesson_plans").delete().eq("id", plan_id).eq("user_id", user_id).execute()
+        invalidate_plan(user_id, plan_id)
+        # Otherwise a plan still queued would be written after the delete
+        await plan_writer.discard(user_id, plan_id)
+        await plans.delete_plan(user_id, plan_id)
         return {"message": "Plan deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,15 +1,52 @@
 import secrets
+import httpx
 from fastapi import APIRouter, HTTPException, Request, Response, Depends
 from fastapi.responses import RedirectResponse
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from app.config import get_settings
 from app.services import spotify as spotify_service
 from app.services import getsongbpm as getsongbpm_service
+from app.services import track_features as track_features_service
+from app.services.spotify_rate_limit import spotify_http_exception
+from app.services.token_refresh import refresh_spotify_token
 from app.services.supabase import get_supabase_client, SupabaseClient
+from app.services.plan_repository import get_plan_repository, PlanRepository
+from app.services.plan_writer import get_plan_writer, PlanWriteQueue
 from app.dependencies import get_current_user_id
+from app.responses import ORJSONResponse
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
+
+
+def _set_access_token_cookie(response: Response, tokens: dict) -> None:
+    response.set_cookie(
+        key="spotify_access_token",
+        value=tokens["access_token"],
+        httponly=True,
+        max_age=tokens.get("expires_in", 3600),
+        samesite="lax"
+    )
+
+
+async def _get_access_token(request: Request, response: Response, http_client: httpx.AsyncClient) -> str:
+    """Get the Spotify access token from cookies, refreshing it (and its cookie) if it has expired."""
+    access_token = request.cookies.get("spotify_access_token")
+    refresh_token = request.cookies.get("spotify_refresh_token")
+
+    if not access_token and not refresh_token:
+        raise HTTPException(status_code=401, detail="Not connected to Spotify")
+
+    # Try to refresh token if no access token
+    if not access_token and refresh_token:
+        try:
+            tokens = await refresh_spotify_token(http_client, refresh_token)
+            access_token = tokens["access_token"]
+            _set_access_token_cookie(response, tokens)
+        except Exception:
+            raise HTTPException(status_code=401, detail="Failed to refresh token")
+
+    return access_token
 
 
 @router.get("/login")
@@ -30,7 +67,13 @@ async def spotify_login(request: Request):
 
 
 @router.get("/callback")
-async def spotify_callback(request: Request, code: str = None, error: str = None, state: str = None):
+async def spotify_callback(
+    request: Request,
+    code: str = None,
+    error: str = None,
+    state: str = None,
+    http_client: httpx.AsyncClient = Depends(spotify_service.get_spotify_http_client),
+):
     """Handle Spotify OAuth callback."""
     if error:
         return RedirectResponse(url=f"/?spotify_error={error}")
@@ -42,10 +85,10 @@ async def spotify_callback(request: Request, code: str = None, error: str = None
         raise HTTPException(status_code=400, detail="State mismatch")
 
     try:
-        tokens = await spotify_service.exchange_code(code)
+        tokens = await spotify_service.exchange_code(http_client, code)
 
         # Get user profile
-        profile = await spotify_service.get_user_profile(tokens["access_token"])
+        profile = await spotify_service.get_user_profile(http_client, tokens["access_token"])
 
         # Redirect to frontend with tokens (stored in fragment for security)
         # Frontend will store these in memory/sessionStorage
@@ -75,7 +118,11 @@ async def spotify_callback(request: Request, code: str = None, error: str = None
 
 
 @router.get("/token")
-async def get_token(request: Request):
+async def get_token(
+    request: Request,
+    response: Response,
+    http_client: httpx.AsyncClient = Depends(spotify_service.get_spotify_http_client),
+):
     """Get current access token for Web Playback SDK."""
     access_token = request.cookies.get("spotify_access_token")
     refresh_token = request.cookies.get("spotify_refresh_token")
@@ -83,9 +130,9 @@ async def get_token(request: Request):
     if not access_token and refresh_token:
         # Try to refresh
         try:
-            tokens = await spotify_service.refresh_access_token(refresh_token)
+            tokens = await refresh_spotify_token(http_client, refresh_token)
             access_token = tokens["access_token"]
-            # Note: Would need to set new cookie in response
+            _set_access_token_cookie(response, tokens)
         except Exception:
             return {"connected": False}
 
@@ -99,7 +146,11 @@ async def get_token(request: Request):
 
 
 @router.post("/refresh")
-async def refresh_token(request: Request, response: Response):
+async def refresh_token(
+    request: Request,
+    response: Response,
+    http_client: httpx.AsyncClient = Depends(spotify_service.get_spotify_http_client),
+):
     """Refresh the access token."""
     refresh_token = request.cookies.get("spotify_refresh_token")
 
@@ -107,26 +158,24 @@ async def refresh_token(request: Request, response: Response):
         raise HTTPException(status_code=401, detail="No refresh token")
 
     try:
-        tokens = await spotify_service.refresh_access_token(refresh_token)
-
-        response.set_cookie(
-            key="spotify_access_token",
-            value=tokens["access_token"],
-            httponly=True,
-            max_age=tokens.get("expires_in", 3600),
-            samesite="lax"
-        )
+        tokens = await refresh_spotify_token(http_client, refresh_token)
+        _set_access_token_cookie(response, tokens)
 
         return {
             "access_token": tokens["access_token"],
             "expires_in": tokens.get("expires_in", 3600),
         }
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Failed to refresh: {str(e)}")
+        raise spotify_http_exception(e, 400, "Failed to refresh")
 
 
 @router.get("/search")
-async def search_tracks(request: Request, q: str, limit: int = 10):
+async def search_tracks(
+    request: Request,
+    q: str,
+    limit: int = 10,
+    http_client: httpx.AsyncClient = Depends(spotify_service.get_spotify_http_client),
+):
     """Search for tracks on Spotify."""
     access_token = request.cookies.get("spotify_access_token")
 
@@ -134,7 +183,7 @@ async def search_tracks(request: Request, q: str, limit: int = 10):
         raise HTTPException(status_code=401, detail="Not connected to Spotify")
 
     try:
-        results = await spotify_service.search_tracks(q, access_token, limit)
+        results = await spotify_service.search_tracks(http_client, q, access_token, limit)
 
         # Simplify response for frontend
         tracks = []
@@ -158,65 +207,87 @@ async def search_tracks(request: Request, q: str, limit: int = 10):
 
         return {"tracks": tracks}
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Search failed: {str(e)}")
+        raise spotify_http_exception(e, 400, "Search failed")
 
 
-@router.get("/audio-features/{track_id}")
-async def get_track_audio_features(request: Request, response: Response, track_id: str):
-    """Get audio features for a track, with GetSongBPM fallback."""
-    access_token = request.cookies.get("spotify_access_token")
-    refresh_token = request.cookies.get("spotify_refresh_token")
+def _format_audio_features(audio_features: dict) -> dict:
+    """Convert cached/Spotify audio features into the frontend's 0-100 scale."""
+    if audio_features.get("source") == track_features_service.SOURCE_GETSONGBPM:
+        # GetSongBPM only provides tempo
+        return {
+            "tempo": audio_features.get("tempo"),
+            "energy": None,
+            "valence": None,
+            "danceability": None,
+        }
 
-    if not access_token and not refresh_token:
-        raise HTTPException(status_code=401, detail="Not connected to Spotify")
+    return {
+        "tempo": round(audio_features.get("tempo", 0)),
+        "energy": round(audio_features.get("energy", 0) * 100),
+        "valence": round(audio_features.get("valence", 0) * 100),
+        "danceability": round(audio_features.get("danceability", 0) * 100),
+    }
 
-    # Try to refresh token if no access token
-    if not access_token and refresh_token:
-        try:
-            tokens = await spotify_service.refresh_access_token(refresh_token)
-            access_token = tokens["access_token"]
-            response.set_cookie(
-                key="spotify_access_token",
-                value=access_token,
-                httponly=True,
-                max_age=tokens.get("expires_in", 3600),
-                samesite="lax"
-            )
-        except Exception:
-            raise HTTPException(status_code=401, detail="Failed to refresh token")
+
+@router.get("/audio-features/{track_id}")
+async def get_track_audio_features(
+    request: Request,
+    response: Response,
+    track_id: str,
+    client: SupabaseClient = Depends(get_supabase_client),
+    http_client: httpx.AsyncClient = Depends(spotify_service.get_spotify_http_client),
+    getsongbpm_client: httpx.AsyncClient = Depends(getsongbpm_service.get_getsongbpm_http_client),
+):
+    """Get audio features for a track, with GetSongBPM fallback. Results are cached across users."""
+    access_token = await _get_access_token(request, response, http_client)
 
     try:
-        # Try Spotify first
-        audio_features = await spotify_service.get_audio_features(track_id, access_token)
+        # Shared cache, then Spotify raced against GetSongBPM
+        audio_features = await track_features_service.resolve_audio_features(
+            client, http_client, getsongbpm_client, track_id, access_token
+        )
 
         if audio_features:
-            return {
-                "tempo": round(audio_features.get("tempo", 0)),
-                "energy": round(audio_features.get("energy", 0) * 100),
-                "valence": round(audio_features.get("valence", 0) * 100),
-                "danceability": round(audio_features.get("danceability", 0) * 100),
-            }
-
-        # Spotify failed (403 or other) - try GetSongBPM fallback
-        track_info = await spotify_service.get_track(track_id, access_token)
-        if track_info:
-            song_name = track_info.get("name", "")
-            artist = track_info["artists"][0]["name"] if track_info.get("artists") else ""
-
-            # Search GetSongBPM
-            bpm_data = await getsongbpm_service.search_song_bpm(song_name, artist)
-            if bpm_data and bpm_data.get("tempo"):
-                return {
-                    "tempo": bpm_data["tempo"],
-                    "energy": None,
-                    "valence": None,
-                    "danceability": None,
-                }
+            return _format_audio_features(audio_features)
 
         return {"tempo": None, "energy": None, "valence": None, "danceability": None}
 
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Failed to get audio features: {str(e)}")
+        raise spotify_http_exception(e, 400, "Failed to get audio features")
+
+
+class AudioFeaturesBatchRequest(BaseModel):
+    track_ids: list[str] = Field(..., min_length=1, max_length=100)
+
+
+@router.post("/audio-features")
+async def get_audio_features_batch(
+    request: Request,
+    response: Response,
+    body: AudioFeaturesBatchRequest,
+    client: SupabaseClient = Depends(get_supabase_client),
+    http_client: httpx.AsyncClient = Depends(spotify_service.get_spotify_http_client),
+    getsongbpm_client: httpx.AsyncClient = Depends(getsongbpm_service.get_getsongbpm_http_client),
+):
+    """
+    Get audio features for many tracks at once (e.g. every song in a plan).
+
+    Returns {"features": {track_id: {...}}}; tracks with no data from any source are omitted.
+    """
+    access_token = await _get_access_token(request, response, http_client)
+
+    try:
+        features = await track_features_service.resolve_audio_features_batch(
+            client, http_client, getsongbpm_client, body.track_ids, access_token
+        )
+        return {
+            "features": {
+                track_id: _format_audio_features(audio_features)
+                for track_id, audio_features in features.items()
+            }
+        }
+    except Exception as e:
+        raise spotify_http_exception(e, 400, "Failed to get audio features")
 
 
 @router.post("/logout")
@@ -228,34 +299,19 @@ async def spotify_logout(response: Response):
 
 
 @router.get("/playlists")
-async def get_user_playlists(request: Request, response: Response):
+async def get_user_playlists(
+    request: Request,
+    response: Response,
+    http_client: httpx.AsyncClient = Depends(spotify_service.get_spotify_http_client),
+):
     """Get current user's Spotify playlists."""
-    access_token = request.cookies.get("spotify_access_token")
-    refresh_token = request.cookies.get("spotify_refresh_token")
-
-    if not access_token and not refresh_token:
-        raise HTTPException(status_code=401, detail="Not connected to Spotify")
-
-    # Refresh token if needed
-    if not access_token and refresh_token:
-        try:
-            tokens = await spotify_service.refresh_access_token(refresh_token)
-            access_token = tokens["access_token"]
-            response.set_cookie(
-                key="spotify_access_token",
-                value=access_token,
-                httponly=True,
-                max_age=tokens.get("expires_in", 3600),
-                samesite="lax"
-            )
-        except Exception:
-            raise HTTPException(status_code=401, detail="Failed to refresh token")
+    access_token = await _get_access_token(request, response, http_client)
 
     try:
-        playlists = await spotify_service.get_user_playlists(access_token)
+        playlists = await spotify_service.get_user_playlists(http_client, access_token)
         return {"playlists": playlists}
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Failed to get playlists: {str(e)}")
+        raise spotify_http_exception(e, 400, "Failed to get playlists")
 
 
 class CreatePlaylistRequest(BaseModel):
@@ -268,7 +324,9 @@ async def create_playlist_from_plan(
     request: Request,
     body: CreatePlaylistRequest,
     user_id: str = Depends(get_current_user_id),
-    client: SupabaseClient = Depends(get_supabase_client),
+    plans: PlanRepository = Depends(get_plan_repository),
+    plan_writer: PlanWriteQueue = Depends(get_plan_writer),
+    http_client: httpx.AsyncClient = Depends(spotify_service.get_spotify_http_client),
 ):
     """Create a Spotify playlist from a saved plan."""
     access_token = request.cookies.get("spotify_access_token")
@@ -278,15 +336,16 @@ async def create_playlist_from_plan(
 
     # Fetch the plan
     try:
-        plan_response = client.table("lesson_plans").select("*").eq("id", body.plan_id).eq("user_id", user_id).single().execute()
-        if not plan_response.data:
+        # The plan may have just been generated and still be queued for saving
+        plan_row = plan_writer.get_pending(user_id, body.plan_id) or await plans.get_plan(user_id, body.plan_id)
+        if not plan_row:
             raise HTTPException(status_code=404, detail="Plan not found")
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch plan: {str(e)}")
 
-    plan_data = plan_response.data["plan_json"]
+    plan_data = plan_row["plan_json"]
     theme = plan_data.get("theme", "Cycle Class")
 
     # Extract track URIs from segments
@@ -302,6 +361,7 @@ async def create_playlist_from_plan(
     # Create the playlist
     try:
         playlist = await spotify_service.create_playlist(
+            http_client,
             access_token=access_token,
             name=f"Cycle Class: {theme}",
             description=f"Generated playlist for {plan_data.get('total_duration_minutes', 0)} minute cycle class",
@@ -310,6 +370,7 @@ async def create_playlist_from_plan(
 
         # Add tracks to the playlist
         await spotify_service.add_tracks_to_playlist(
+            http_client,
             access_token=access_token,
             playlist_id=playlist["id"],
             track_uris=track_uris,
@@ -323,4 +384,4 @@ async def create_playlist_from_plan(
         }
 
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Failed to create playlist: {str(e)}")
+        raise spotify_http_exception(e, 400, "Failed to create playlist")
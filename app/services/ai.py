@@ -1,12 +1,20 @@
 import json
 import logging
-from anthropic import Anthropic
+import re
+from collections.abc import AsyncIterator
+
+from anthropic import AsyncAnthropic
+from fastapi import Request
 
 from app.config import get_settings
-from app.models.schemas import LessonPlan, Segment
+from app.models.schemas import MAX_THEME_LENGTH, LessonPlan, Segment
+from app.services.segment_parser import SegmentStreamParser
 
 logger = logging.getLogger(__name__)
 
+MODEL = "claude-sonnet-4-20250514"
+MAX_TOKENS = 8192
+
 SYSTEM_PROMPT = """You are an expert cycle/spin class instructor helping to create lesson plans.
 
 When given a theme and duration, create a structured workout plan with varied segments including:
@@ -95,12 +103,19 @@ IMPORTANT: Respond ONLY with valid JSON matching this exact structure:
 }"""
 
 
-async def generate_lesson_plan(theme: str, duration_minutes: int) -> LessonPlan:
-    """Generate a cycle class lesson plan using Claude."""
+def create_anthropic_client() -> AsyncAnthropic:
+    """Create the shared async Anthropic client (owned by the app lifespan)."""
     settings = get_settings()
-    client = Anthropic(api_key=settings.anthropic_api_key)
+    return AsyncAnthropic(api_key=settings.anthropic_api_key)
+
 
-    user_prompt = f"""Create a {duration_minutes}-minute cycle class lesson plan with the theme: "{theme}"
+def get_anthropic_client(request: Request) -> AsyncAnthropic:
+    """Get the shared Anthropic client created in the app lifespan."""
+    return request.app.state.anthropic_client
+
+
+def _build_user_prompt(theme: str, duration_minutes: int) -> str:
+    return f"""Create a {duration_minutes}-minute cycle class lesson plan with the theme: "{theme}"
 
 Remember to:
 - Start with a warm-up
@@ -111,37 +126,28 @@ Remember to:
 
 Respond with ONLY the JSON, no additional text."""
 
-    logger.info(f"Generating lesson plan: theme='{theme}', duration={duration_minutes}min")
-
-    message = client.messages.create(
-        model="claude-sonnet-4-20250514",
-        max_tokens=8192,
-        messages=[
-            {"role": "user", "content": user_prompt}
-        ],
-        system=SYSTEM_PROMPT,
-    )
-
-    # Extract the text content
-    response_text = message.content[0].text
 
+def _check_response(message) -> None:
+    """Log token usage and reject truncated responses."""
     logger.info(f"AI response received: stop_reason={message.stop_reason}, "
                 f"input_tokens={message.usage.input_tokens}, output_tokens={message.usage.output_tokens}")
-    logger.debug(f"AI response text: {response_text[:500]}...")
 
     # Check if response was truncated
     if message.stop_reason == "max_tokens":
         logger.error(f"AI response truncated at {message.usage.output_tokens} tokens")
         raise ValueError("AI response was truncated. Try a shorter duration or simpler theme.")
 
-    # Parse JSON response
+
+def parse_lesson_plan(response_text: str) -> LessonPlan:
+    """Parse the model's JSON response (optionally wrapped in markdown) into a LessonPlan."""
+    logger.debug(f"AI response text: {response_text[:500]}...")
+
     try:
         plan_data = json.loads(response_text)
         logger.info(f"Successfully parsed JSON response with {len(plan_data.get('segments', []))} segments")
     except json.JSONDecodeError as e:
         logger.warning(f"Direct JSON parse failed: {e}. Attempting markdown extraction.")
         # Try to extract JSON from the response if it's wrapped in markdown
-        import re
         json_match = re.search(r'```(?:json)?\s*([\s\S]*?)\s*```', response_text)
         if json_match:
             try:
@@ -154,5 +160,43 @@ Respond with ONLY the JSON, no additional text."""
             logger.error(f"No JSON found in response: {response_text[:500]}")
             raise ValueError(f"Failed to parse AI response as JSON: {response_text[:200]}")
 
+    # Don't fail a whole generation over a long-winded theme
+    if isinstance(plan_data.get("theme"), str):
+        plan_data["theme"] = plan_data["theme"][:MAX_THEME_LENGTH]
+
     # Validate and create the LessonPlan
     return LessonPlan(**plan_data)
+
+
+async def stream_lesson_plan(
+    client: AsyncAnthropic,
+    theme: str,
+    duration_minutes: int,
+) -> AsyncIterator[tuple[str, str | Segment | LessonPlan]]:
+    """
+    Generate a cycle class lesson plan using Claude, yielding output as the model writes it.
+
+    Yields ("text", chunk) for every piece of streamed text and ("segment", Segment)
+    as soon as each segment object is complete, followed by a single
+    ("plan", LessonPlan) once the full response has been parsed.
+    """
+    logger.info(f"Streaming lesson plan: theme='{theme}', duration={duration_minutes}min")
+
+    async with client.messages.stream(
+        model=MODEL,
+        max_tokens=MAX_TOKENS,
+        messages=[
+            {"role": "user", "content": _build_user_prompt(theme, duration_minutes)}
+        ],
+        system=SYSTEM_PROMPT,
+    ) as stream:
+        parser = SegmentStreamParser()
+        async for text in stream.text_stream:
+            yield "text", text
+            for segment in parser.feed(text):
+                yield "segment", segment
+        message = await stream.get_final_message()
+
+    _check_response(message)
+
+    yield "plan", parse_lesson_plan(message.content[0].text)
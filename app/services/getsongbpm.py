@@ -1,4 +1,5 @@
 import httpx
+from fastapi import Request
 from urllib.parse import urlparse
 from app.config import get_settings
 
@@ -16,7 +17,27 @@ def _get_user_agent() -> str:
     return f"CyclePlanner/1.0 ({site_url})"
 
 
-async def search_song_bpm(song_name: str, artist: str | None = None) -> dict | None:
+def create_getsongbpm_http_client() -> httpx.AsyncClient:
+    """Create the shared, pooled HTTP client for GetSongBPM (owned by the app lifespan)."""
+    settings = get_settings()
+    return httpx.AsyncClient(
+        headers={"User-Agent": _get_user_agent()},
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=settings.getsongbpm_max_connections,
+            max_keepalive_connections=settings.getsongbpm_max_keepalive_connections,
+            keepalive_expiry=settings.http_keepalive_expiry_seconds,
+        ),
+        timeout=httpx.Timeout(settings.getsongbpm_timeout_seconds, connect=settings.http_connect_timeout_seconds),
+    )
+
+
+def get_getsongbpm_http_client(request: Request) -> httpx.AsyncClient:
+    """Get the shared GetSongBPM HTTP client created in the app lifespan."""
+    return request.app.state.getsongbpm_http_client
+
+
+async def search_song_bpm(http_client: httpx.AsyncClient, song_name: str, artist: str | None = None) -> dict | None:
     """Search for a song's BPM and other audio features using GetSongBPM API."""
     settings = get_settings()
 
@@ -28,46 +49,44 @@ async def search_song_bpm(song_name: str, artist: str | None = None) -> dict | N
     query = song_name
 
     try:
-        async with httpx.AsyncClient(headers={"User-Agent": _get_user_agent()}) as client:
-            response = await client.get(
-                f"{GETSONGBPM_API_URL}/search/",
-                params={
-                    "api_key": settings.getsongbpm_api_key,
-                    "type": "song",
-                    "lookup": query,
-                },
-                timeout=3.0,
-            )
-
-            print(f"[getsongbpm] Search for '{query}' status={response.status_code}")
-
-            if response.status_code != 200:
-                print(f"[getsongbpm] Error: {response.text}")
-                return None
-
-            data = response.json()
-
-            # GetSongBPM returns a list on success, dict with error on failure
-            search_results = data.get("search")
-            if isinstance(search_results, list) and len(search_results) > 0:
-                song = search_results[0]
-                result = {
-                    "tempo": int(song.get("tempo", 0)) if song.get("tempo") else None,
-                    "key": song.get("key_of"),
-                    "source": "getsongbpm",
-                }
-                print(f"[getsongbpm] Found: {result}")
-                return result
-
-            print(f"[getsongbpm] No results for '{query}'")
+        response = await http_client.get(
+            f"{GETSONGBPM_API_URL}/search/",
+            params={
+                "api_key": settings.getsongbpm_api_key,
+                "type": "song",
+                "lookup": query,
+            },
+        )
+
+        print(f"[getsongbpm] Search for '{query}' status={response.status_code}")
+
+        if response.status_code != 200:
+            print(f"[getsongbpm] Error: {response.text}")
             return None
 
+        data = response.json()
+
+        # GetSongBPM returns a list on success, dict with error on failure
+        search_results = data.get("search")
+        if isinstance(search_results, list) and len(search_results) > 0:
+            song = search_results[0]
+            result = {
+                "tempo": int(song.get("tempo", 0)) if song.get("tempo") else None,
+                "key": song.get("key_of"),
+                "source": "getsongbpm",
+            }
+            print(f"[getsongbpm] Found: {result}")
+            return result
+
+        print(f"[getsongbpm] No results for '{query}'")
+        return None
+
     except Exception as e:
         print(f"[getsongbpm] Exception: {e}")
         return None
 
 
-async def get_song_by_id(song_id: str) -> dict | None:
+async def get_song_by_id(http_client: httpx.AsyncClient, song_id: str) -> dict | None:
     """Get song details by GetSongBPM song ID."""
     settings = get_settings()
 
@@ -75,26 +94,24 @@ async def get_song_by_id(song_id: str) -> dict | None:
         return None
 
     try:
-        async with httpx.AsyncClient(headers={"User-Agent": _get_user_agent()}) as client:
-            response = await client.get(
-                f"{GETSONGBPM_API_URL}/song/",
-                params={
-                    "api_key": settings.getsongbpm_api_key,
-                    "id": song_id,
-                },
-                timeout=3.0,
-            )
-
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("song"):
-                    song = data["song"]
-                    return {
-                        "tempo": int(song.get("tempo", 0)) if song.get("tempo") else None,
-                        "key": song.get("key_of"),
-                        "source": "getsongbpm",
-                    }
-            return None
+        response = await http_client.get(
+            f"{GETSONGBPM_API_URL}/song/",
+            params={
+                "api_key": settings.getsongbpm_api_key,
+                "id": song_id,
+            },
+        )
+
+        if response.status_code == 200:
+            data = response.json()
+            if data.get("song"):
+                song = data["song"]
+                return {
+                    "tempo": int(song.get("tempo", 0)) if song.get("tempo") else None,
+                    "key": song.get("key_of"),
+                    "source": "getsongbpm",
+                }
+        return None
 
     except Exception as e:
         print(f"[getsongbpm] Exception getting song by ID: {e}")
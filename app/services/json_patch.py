@@ -0,0 +1,181 @@
+"""
+RFC 6902 JSON Patch for lesson plan documents.
+
+Patches are applied copy-on-write: only the containers along each operation's
+path are copied, and everything else in the result is the same object as in the
+original document. Callers can therefore tell which parts a patch touched with
+an identity check (`part is original_part`) and validate only those.
+"""
+import copy
+from typing import Any, Literal
+
+from pydantic import BaseModel, Field
+
+
+class JsonPatchError(ValueError):
+    """A patch operation that can't be applied to the document."""
+
+
+class MalformedPatch(JsonPatchError):
+    """A patch that isn't a well-formed RFC 6902 document (e.g. an operation missing its value)."""
+
+
+class PatchOperation(BaseModel):
+    """A single RFC 6902 operation."""
+    op: Literal["add", "remove", "replace", "move", "copy", "test"]
+    path: str
+    value: Any = None
+    from_: str | None = Field(default=None, alias="from")
+
+
+def parse_pointer(pointer: str) -> list[str]:
+    """Split an RFC 6901 JSON Pointer into unescaped reference tokens."""
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise MalformedPatch(f"Invalid JSON pointer: {pointer!r}")
+    return [token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")]
+
+
+def _list_index(container: list, token: str, allow_end: bool = False) -> int:
+    if token == "-" and allow_end:
+        return len(container)
+    if not token.isdigit() or (token != "0" and token.startswith("0")):
+        raise JsonPatchError(f"Invalid array index: {token!r}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise JsonPatchError(f"Array index out of range: {index}")
+    return index
+
+
+def _resolve(document: Any, tokens: list[str]) -> Any:
+    value = document
+    for token in tokens:
+        if isinstance(value, dict):
+            if token not in value:
+                raise JsonPatchError(f"Path not found: /{'/'.join(tokens)}")
+            value = value[token]
+        elif isinstance(value, list):
+            value = value[_list_index(value, token)]
+        else:
+            raise JsonPatchError(f"Path not found: /{'/'.join(tokens)}")
+    return value
+
+
+def _modify(document: Any, tokens: list[str], action) -> Any:
+    """Return a copy of document with action(parent_copy, last_token) applied at tokens."""
+    if isinstance(document, dict):
+        parent = dict(document)
+    elif isinstance(document, list):
+        parent = list(document)
+    else:
+        raise JsonPatchError("Path not found")
+
+    token, rest = tokens[0], tokens[1:]
+    if not rest:
+        action(parent, token)
+        return parent
+
+    key = _list_index(parent, token) if isinstance(parent, list) else token
+    if isinstance(parent, dict) and key not in parent:
+        raise JsonPatchError(f"Path not found: {token}")
+    parent[key] = _modify(parent[key], rest, action)
+    return parent
+
+
+def _add(document: Any, tokens: list[str], value: Any) -> Any:
+    if not tokens:
+        return value
+
+    def action(parent, token):
+        if isinstance(parent, list):
+            parent.insert(_list_index(parent, token, allow_end=True), value)
+        else:
+            parent[token] = value
+
+    return _modify(document, tokens, action)
+
+
+def _remove(document: Any, tokens: list[str]) -> Any:
+    if not tokens:
+        raise JsonPatchError("Can't remove the whole document")
+
+    def action(parent, token):
+        if isinstance(parent, list):
+            del parent[_list_index(parent, token)]
+        elif token in parent:
+            del parent[token]
+        else:
+            raise JsonPatchError(f"Path not found: {token}")
+
+    return _modify(document, tokens, action)
+
+
+def _replace(document: Any, tokens: list[str], value: Any) -> Any:
+    if not tokens:
+        return value
+
+    def action(parent, token):
+        if isinstance(parent, list):
+            parent[_list_index(parent, token)] = value
+        elif token in parent:
+            parent[token] = value
+        else:
+            raise JsonPatchError(f"Path not found: {token}")
+
+    return _modify(document, tokens, action)
+
+
+def _json_equal(a: Any, b: Any) -> bool:
+    """JSON equality (RFC 6902 test): same JSON type and value; booleans are not numbers."""
+    if isinstance(a, bool) or isinstance(b, bool):
+        return isinstance(a, bool) and isinstance(b, bool) and a == b
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return a == b
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(_json_equal(value, b[key]) for key, value in a.items())
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(_json_equal(x, y) for x, y in zip(a, b))
+    return type(a) is type(b) and a == b
+
+
+def _check_operations(operations: list[PatchOperation]) -> None:
+    for operation in operations:
+        parse_pointer(operation.path)
+        if operation.op in ("add", "replace", "test") and "value" not in operation.model_fields_set:
+            raise MalformedPatch(f"'{operation.op}' requires 'value'")
+        if operation.op in ("move", "copy"):
+            if operation.from_ is None:
+                raise MalformedPatch(f"'{operation.op}' requires 'from'")
+            parse_pointer(operation.from_)
+
+
+def apply_patch(document: Any, operations: list[PatchOperation]) -> Any:
+    """
+    Apply operations in order and return the patched document. The original is
+    not modified. Raises MalformedPatch if any operation is malformed, or
+    JsonPatchError if any operation fails (nothing is applied).
+    """
+    _check_operations(operations)
+    for operation in operations:
+        tokens = parse_pointer(operation.path)
+        if operation.op == "add":
+            document = _add(document, tokens, operation.value)
+        elif operation.op == "remove":
+            document = _remove(document, tokens)
+        elif operation.op == "replace":
+            document = _replace(document, tokens, operation.value)
+        elif operation.op == "test":
+            if not _json_equal(_resolve(document, tokens), operation.value):
+                raise JsonPatchError(f"Test failed: {operation.path}")
+        else:
+            from_tokens = parse_pointer(operation.from_)
+            value = _resolve(document, from_tokens)
+            if operation.op == "move":
+                if tokens[:len(from_tokens)] == from_tokens and tokens != from_tokens:
+                    raise JsonPatchError("Can't move a value into itself")
+                document = _remove(document, from_tokens)
+            else:
+                value = copy.deepcopy(value)
+            document = _add(document, tokens, value)
+    return document
@@ -0,0 +1,18 @@
+"""
+In-process counters for operational metrics (cache hits, upstream throttling, etc.).
+
+Note: Counters are per worker process and reset on server restart.
+"""
+from collections import Counter
+
+_counters: Counter[str] = Counter()
+
+
+def increment(name: str, amount: float = 1) -> None:
+    """Increment a named counter."""
+    _counters[name] += amount
+
+
+def get_metrics() -> dict[str, float]:
+    """Snapshot of all counters."""
+    return dict(_counters)
@@ -0,0 +1,60 @@
+"""
+Read cache for full lesson plans, validated by updated_at.
+
+Fetching a plan first reads only its updated_at, which is cheap. A cached copy
+is used if it carries the same updated_at, so a cached plan is never served
+after another worker has changed it. The same updated_at also gives the
+plan's ETag, so conditional requests can be answered with 304 before the
+plan body is loaded at all.
+
+Entries are keyed by (user_id, plan_id) and dropped on update and delete.
+
+Note: Uses in-memory storage, so the cache is per worker process.
+"""
+import hashlib
+from datetime import datetime
+
+from app.config import get_settings
+from app.services import metrics
+from app.services.cache import LRUCache
+
+_plans = LRUCache(max_entries=get_settings().plan_cache_size)
+
+
+def plan_etag(plan_id: str, updated_at: str) -> str:
+    """Strong ETag for a version of a plan."""
+    # Normalized, since backends format the same timestamp differently (e.g. trailing zeros)
+    version = datetime.fromisoformat(updated_at).isoformat()
+    digest = hashlib.sha256(f"{plan_id}:{version}".encode()).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def etag_matches(header: str | None, etag: str, weak: bool = True) -> bool:
+    """
+    Whether an If-None-Match (weak comparison) or If-Match (strong comparison,
+    weak=False) header matches the ETag.
+    """
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    if not weak:
+        # A weak tag (W/"x") never matches under strong comparison
+        return "*" in candidates or etag in candidates
+    return "*" in candidates or etag in (candidate.removeprefix("W/") for candidate in candidates)
+
+
+def get_cached_plan(user_id: str, plan_id: str, updated_at: str) -> dict | None:
+    """Get the cached plan if it is still the current version."""
+    entry = _plans.get((user_id, plan_id))
+    plan = entry if entry and entry["updated_at"] == updated_at else None
+    metrics.increment("plan_cache_hits_total" if plan else "plan_cache_misses_total")
+    return plan
+
+
+def cache_plan(user_id: str, plan: dict) -> None:
+    _plans.set((user_id, plan["id"]), plan)
+
+
+def invalidate_plan(user_id: str, plan_id: str) -> None:
+    """Forget a cached plan (on update or delete)."""
+    _plans.delete((user_id, plan_id))
@@ -0,0 +1,378 @@
+"""
+Storage for lesson plans.
+
+Routers read and write `lesson_plans` through a PlanRepository, so the backend
+can be chosen with the PLANS_BACKEND setting:
+- "supabase": PostgREST via the shared Supabase client (default)
+- "postgres": direct pooled connection to DATABASE_URL via the async SQLAlchemy engine
+
+Both return rows as plain dicts shaped like the PostgREST response (string IDs, ISO timestamps).
+
+Plan lists return summary fields only (no plan_json) and are paginated by keyset
+on (created_at, id), newest first; cursors are opaque to clients. Search results
+are the same summaries, ranked by the search_lesson_plans() database function
+and paginated by keyset on (rank, id).
+"""
+import base64
+import json
+import uuid
+from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator
+from datetime import datetime, timezone
+
+from fastapi import Request
+from sqlalchemy import Select, delete, func, insert, select, text, tuple_, update
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+
+from app.config import get_settings
+from app.models.database import LessonPlanDB
+from app.services.plan_summary import SUMMARY_COLUMNS
+from app.services.supabase import SupabaseClient
+
+BACKEND_SUPABASE = "supabase"
+BACKEND_POSTGRES = "postgres"
+
+# Columns returned for each plan in list and search responses
+PLAN_SUMMARY_COLUMNS = ("id", "theme", "duration_minutes", "created_at", "updated_at", *SUMMARY_COLUMNS)
+
+# Columns returned for a full plan (everything except the generated search columns)
+PLAN_COLUMNS = ("id", "user_id", "theme", "duration_minutes", "plan_json", "created_at", "updated_at", *SUMMARY_COLUMNS)
+
+
+class InvalidCursor(ValueError):
+    """A list cursor that wasn't produced by encode_cursor."""
+
+
+def _encode_cursor(values: list) -> str:
+    raw = json.dumps(values).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> list:
+    return json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+
+
+def encode_cursor(plan: dict) -> str:
+    """Cursor for the page after the given plan (the last one on the current page)."""
+    return _encode_cursor([plan["created_at"], plan["id"]])
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    """Decode a cursor into the (created_at, id) of the last plan already returned."""
+    try:
+        created_at, plan_id = _decode_cursor(cursor)
+        return datetime.fromisoformat(created_at), str(uuid.UUID(plan_id))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor("Invalid cursor") from e
+
+
+def encode_search_cursor(result: dict) -> str:
+    """Cursor for the search page after the given result (the last one on the current page)."""
+    return _encode_cursor([result["rank"], result["id"]])
+
+
+def decode_search_cursor(cursor: str) -> tuple[float, str]:
+    """Decode a search cursor into the (rank, id) of the last result already returned."""
+    try:
+        rank, plan_id = _decode_cursor(cursor)
+        if not isinstance(rank, (int, float)) or isinstance(rank, bool):
+            raise TypeError("rank must be a number")
+        return float(rank), str(uuid.UUID(plan_id))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor("Invalid cursor") from e
+
+
+class PlanRepository(ABC):
+    """Interface for lesson plan storage. All methods are scoped to the owning user."""
+
+    @abstractmethod
+    async def list_plans(self, user_id: str, limit: int, after: tuple[datetime, str] | None = None) -> list[dict]:
+        """
+        Summaries of the user's plans, newest first. `after` is a decoded cursor;
+        only plans older than it are returned.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def search_plans(
+        self, user_id: str, query: str, limit: int, after: tuple[float, str] | None = None
+    ) -> list[dict]:
+        """
+        Summaries (plus their rank) of the user's plans matching a search query,
+        best match first. `after` is a decoded search cursor.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_plans(self, user_id: str, batch_size: int) -> AsyncIterator[dict]:
+        """
+        All of the user's full plans, newest first, fetched batch_size rows at a
+        time so memory use doesn't grow with the size of the library.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_plan(self, user_id: str, plan_id: str) -> dict | None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_plan_updated_at(self, user_id: str, plan_id: str) -> str | None:
+        """The plan's updated_at (its version), without loading the plan. None if the user has no such plan."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def insert_plan(self, data: dict) -> None:
+        """Insert a plan row (data includes its id and user_id)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def insert_plans(self, rows: list[dict]) -> None:
+        """Insert plan rows in one statement, skipping IDs that already exist (safe to replay)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update_plan(
+        self, user_id: str, plan_id: str, data: dict, expected_updated_at: str | None = None
+    ) -> str | None:
+        """
+        Update a plan and return its new updated_at. Returns None if the user has
+        no such plan or, when expected_updated_at is given, if the plan has changed since.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_plan(self, user_id: str, plan_id: str) -> None:
+        raise NotImplementedError
+
+
+class SupabasePlanRepository(PlanRepository):
+    """Lesson plans stored through PostgREST."""
+
+    def __init__(self, client: SupabaseClient):
+        self._client = client
+
+    def _page_query(self, user_id: str, columns: tuple[str, ...], limit: int, after: tuple[datetime, str] | None):
+        query = self._client.table("lesson_plans").select(",".join(columns)).eq("user_id", user_id)
+        if after:
+            created_at, plan_id = after
+            query = query.or_(
+                f'created_at.lt."{created_at.isoformat()}",'
+                f'and(created_at.eq."{created_at.isoformat()}",id.lt.{plan_id})'
+            )
+        return query.order("created_at", desc=True).order("id", desc=True).limit(limit)
+
+    async def list_plans(self, user_id: str, limit: int, after: tuple[datetime, str] | None = None) -> list[dict]:
+        response = await self._page_query(user_id, PLAN_SUMMARY_COLUMNS, limit, after).execute()
+        return response.data
+
+    async def search_plans(
+        self, user_id: str, query: str, limit: int, after: tuple[float, str] | None = None
+    ) -> list[dict]:
+        after_rank, after_id = after or (None, None)
+        response = await self._client.rpc("search_lesson_plans", {
+            "p_user_id": user_id,
+            "p_query": query,
+            "p_limit": limit,
+            "p_after_rank": after_rank,
+            "p_after_id": after_id,
+        }).execute()
+        return response.data
+
+    async def iter_plans(self, user_id: str, batch_size: int) -> AsyncIterator[dict]:
+        # PostgREST has no server-side cursors, so walk the list keyset one page at a time
+        after = None
+        while True:
+            response = await self._page_query(user_id, PLAN_COLUMNS, batch_size, after).execute()
+            for row in response.data:
+                yield row
+            if len(response.data) < batch_size:
+                return
+            last = response.data[-1]
+            after = (datetime.fromisoformat(last["created_at"]), last["id"])
+
+    async def get_plan(self, user_id: str, plan_id: str) -> dict | None:
+        response = await self._client.table("lesson_plans").select(",".join(PLAN_COLUMNS)).eq("id", plan_id).eq("user_id", user_id).limit(1).execute()
+        return response.data[0] if response.data else None
+
+    async def get_plan_updated_at(self, user_id: str, plan_id: str) -> str | None:
+        response = await self._client.table("lesson_plans").select("updated_at").eq("id", plan_id).eq("user_id", user_id).limit(1).execute()
+        return response.data[0]["updated_at"] if response.data else None
+
+    async def insert_plan(self, data: dict) -> None:
+        await self._client.table("lesson_plans").insert(data).execute()
+
+    async def insert_plans(self, rows: list[dict]) -> None:
+        await self._client.table("lesson_plans").upsert(rows, on_conflict="id", ignore_duplicates=True).execute()
+
+    async def update_plan(
+        self, user_id: str, plan_id: str, data: dict, expected_updated_at: str | None = None
+    ) -> str | None:
+        data = {**data, "updated_at": datetime.now(timezone.utc).isoformat()}
+        query = self._client.table("lesson_plans").update(data).eq("id", plan_id).eq("user_id", user_id)
+        if expected_updated_at:
+            query = query.eq("updated_at", expected_updated_at)
+        response = await query.execute()
+        return response.data[0]["updated_at"] if response.data else None
+
+    async def delete_plan(self, user_id: str, plan_id: str) -> None:
+        await self._client.table("lesson_plans").delete().eq("id", plan_id).eq("user_id", user_id).execute()
+
+
+def _parse_plan_id(plan_id: str) -> uuid.UUID | None:
+    try:
+        return uuid.UUID(plan_id)
+    except ValueError:
+        return None
+
+
+def list_plans_query(user_id: str, limit: int, after: tuple[datetime, str] | None = None) -> Select:
+    """
+    A page of the newest-first plan list, after the (created_at, id) keyset cursor.
+
+    Only reads columns carried by ix_lesson_plans_user_id_created_at, so it runs
+    as an index-only scan (checked in tests/test_plan_list_query_plan.py).
+    """
+    query = select(*(getattr(LessonPlanDB, column) for column in PLAN_SUMMARY_COLUMNS)).where(
+        LessonPlanDB.user_id == user_id
+    )
+    if after:
+        created_at, plan_id = after
+        query = query.where(tuple_(LessonPlanDB.created_at, LessonPlanDB.id) < tuple_(created_at, uuid.UUID(plan_id)))
+    return query.order_by(LessonPlanDB.created_at.desc(), LessonPlanDB.id.desc()).limit(limit)
+
+
+def _row_values(row: dict) -> dict:
+    """Convert a PostgREST-shaped row (string ID and timestamps) to column values."""
+    values = {**row, "id": uuid.UUID(row["id"])}
+    for key in ("created_at", "updated_at"):
+        if isinstance(values.get(key), str):
+            values[key] = datetime.fromisoformat(values[key])
+    return values
+
+
+def _row_to_dict(row) -> dict:
+    """Convert a row (full plan or summary) to the shape PostgREST returns."""
+    data = {column.key: getattr(row, column.key) for column in LessonPlanDB.__table__.columns if hasattr(row, column.key)}
+    data["id"] = str(data["id"])
+    for key in ("created_at", "updated_at"):
+        if data.get(key):
+            data[key] = data[key].isoformat()
+    return data
+
+
+class SqlAlchemyPlanRepository(PlanRepository):
+    """Lesson plans stored over a direct pooled Postgres connection."""
+
+    def __init__(self, engine: AsyncEngine):
+        self._sessionmaker = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def list_plans(self, user_id: str, limit: int, after: tuple[datetime, str] | None = None) -> list[dict]:
+        async with self._sessionmaker() as session:
+            result = await session.execute(list_plans_query(user_id, limit, after))
+            return [_row_to_dict(row) for row in result]
+
+    async def search_plans(
+        self, user_id: str, query: str, limit: int, after: tuple[float, str] | None = None
+    ) -> list[dict]:
+        after_rank, after_id = after or (None, None)
+        statement = text(
+            "SELECT * FROM search_lesson_plans(:user_id, :query, :limit, :after_rank, :after_id)"
+        )
+        async with self._sessionmaker() as session:
+            result = await session.execute(statement, {
+                "user_id": user_id,
+                "query": query,
+                "limit": limit,
+                "after_rank": after_rank,
+                "after_id": uuid.UUID(after_id) if after_id else None,
+            })
+            return [{**_row_to_dict(row), "rank": row.rank} for row in result]
+
+    async def iter_plans(self, user_id: str, batch_size: int) -> AsyncIterator[dict]:
+        # Streamed through a server-side cursor; holds a pooled connection until the export finishes
+        query = (
+            select(*(getattr(LessonPlanDB, column) for column in PLAN_COLUMNS))
+            .where(LessonPlanDB.user_id == user_id)
+            .order_by(LessonPlanDB.created_at.desc(), LessonPlanDB.id.desc())
+            .execution_options(yield_per=batch_size)
+        )
+        async with self._sessionmaker() as session:
+            result = await session.stream(query)
+            async for row in result:
+                yield _row_to_dict(row)
+
+    async def get_plan(self, user_id: str, plan_id: str) -> dict | None:
+        plan_uuid = _parse_plan_id(plan_id)
+        if plan_uuid is None:
+            return None
+        async with self._sessionmaker() as session:
+            result = await session.execute(
+                select(*(getattr(LessonPlanDB, column) for column in PLAN_COLUMNS)).where(
+                    LessonPlanDB.id == plan_uuid, LessonPlanDB.user_id == user_id
+                )
+            )
+            plan = result.one_or_none()
+            return _row_to_dict(plan) if plan else None
+
+    async def get_plan_updated_at(self, user_id: str, plan_id: str) -> str | None:
+        plan_uuid = _parse_plan_id(plan_id)
+        if plan_uuid is None:
+            return None
+        async with self._sessionmaker() as session:
+            updated_at = await session.scalar(
+                select(LessonPlanDB.updated_at).where(LessonPlanDB.id == plan_uuid, LessonPlanDB.user_id == user_id)
+            )
+            return updated_at.isoformat() if updated_at else None
+
+    async def insert_plan(self, data: dict) -> None:
+        async with self._sessionmaker.begin() as session:
+            await session.execute(insert(LessonPlanDB).values(_row_values(data)))
+
+    async def insert_plans(self, rows: list[dict]) -> None:
+        values = [_row_values(row) for row in rows]
+        async with self._sessionmaker.begin() as session:
+            await session.execute(
+                postgresql.insert(LessonPlanDB).values(values).on_conflict_do_nothing(index_elements=[LessonPlanDB.id])
+            )
+
+    async def update_plan(
+        self, user_id: str, plan_id: str, data: dict, expected_updated_at: str | None = None
+    ) -> str | None:
+        plan_uuid = _parse_plan_id(plan_id)
+        if plan_uuid is None:
+            return None
+        query = update(LessonPlanDB).where(LessonPlanDB.id == plan_uuid, LessonPlanDB.user_id == user_id)
+        if expected_updated_at:
+            query = query.where(LessonPlanDB.updated_at == datetime.fromisoformat(expected_updated_at))
+        async with self._sessionmaker.begin() as session:
+            updated_at = await session.scalar(
+                query.values({**data, "updated_at": func.now()}).returning(LessonPlanDB.updated_at)
+            )
+            return updated_at.isoformat() if updated_at else None
+
+    async def delete_plan(self, user_id: str, plan_id: str) -> None:
+        plan_uuid = _parse_plan_id(plan_id)
+        if plan_uuid is None:
+            return
+        async with self._sessionmaker.begin() as session:
+            await session.execute(
+                delete(LessonPlanDB).where(LessonPlanDB.id == plan_uuid, LessonPlanDB.user_id == user_id)
+            )
+
+
+def create_plan_repository(supabase: SupabaseClient, engine: AsyncEngine | None) -> PlanRepository:
+    """Create the plan repository for the configured backend (owned by the app lifespan)."""
+    backend = get_settings().plans_backend
+    if backend == BACKEND_POSTGRES:
+        if engine is None:
+            raise ValueError("PLANS_BACKEND=postgres requires DATABASE_URL")
+        return SqlAlchemyPlanRepository(engine)
+    if backend == BACKEND_SUPABASE:
+        return SupabasePlanRepository(supabase)
+    raise ValueError(f"Unknown PLANS_BACKEND: {backend}")
+
+
+def get_plan_repository(request: Request) -> PlanRepository:
+    """Get the plan repository created in the app lifespan."""
+    return request.app.state.plan_repository
@@ -0,0 +1,90 @@
+"""
+Summary columns stored alongside each lesson plan.
+
+Plans are saved as one JSONB document, so the numbers shown in lists (segment
+count, linked songs, time at each intensity, ...) are computed once on every
+write and stored in their own columns instead of being re-derived from
+plan_json on every read. Rows written before these columns existed are filled
+in by app.jobs.backfill_plan_summaries.
+"""
+import re
+
+from app.models.schemas import LessonPlan
+
+INTENSITIES = ("low", "medium", "high")
+
+SUMMARY_COLUMNS = (
+    "segment_count",
+    "linked_track_count",
+    "song_coverage",
+    "avg_bpm",
+    "low_intensity_seconds",
+    "medium_intensity_seconds",
+    "high_intensity_seconds",
+)
+
+_BPM_RANGE = re.compile(r"(\d+)(?:\s*-\s*(\d+))?")
+
+
+def _bpm_midpoint(bpm_range: str | None) -> float | None:
+    """Midpoint of a suggested BPM range like "90-100" or "120+"."""
+    match = _BPM_RANGE.search(bpm_range or "")
+    if not match:
+        return None
+    low = int(match.group(1))
+    high = int(match.group(2)) if match.group(2) else low
+    return (low + high) / 2
+
+
+def compute_plan_summary(plan_json: dict) -> dict:
+    """Compute the summary columns for a (validated) plan document."""
+    intensity_seconds = dict.fromkeys(INTENSITIES, 0)
+    bpm_weighted_total = 0.0
+    bpm_seconds = 0
+    total_seconds = 0
+    linked_seconds = 0
+
+    segments = plan_json["segments"]
+    for segment in segments:
+        total_seconds += segment["duration_seconds"]
+        if segment.get("spotify_uri"):
+            linked_seconds += segment["duration_seconds"]
+
+        # Sub-segments (when present) describe what actually happens during the song
+        parts = segment.get("sub_segments") or [segment]
+        for part in parts:
+            intensity = part["intensity"].lower()
+            if intensity in intensity_seconds:
+                intensity_seconds[intensity] += part["duration_seconds"]
+
+            bpm = _bpm_midpoint(part.get("suggested_bpm_range")) or _bpm_midpoint(segment.get("suggested_bpm_range"))
+            if bpm is not None:
+                bpm_weighted_total += bpm * part["duration_seconds"]
+                bpm_seconds += part["duration_seconds"]
+
+    return {
+        "segment_count": len(segments),
+        "linked_track_count": sum(1 for segment in segments if segment.get("spotify_uri")),
+        # Share of class time with a linked song
+        "song_coverage": round(linked_seconds / total_seconds, 4) if total_seconds else None,
+        # Time-weighted average of the suggested BPM ranges
+        "avg_bpm": round(bpm_weighted_total / bpm_seconds, 1) if bpm_seconds else None,
+        "low_intensity_seconds": intensity_seconds["low"],
+        "medium_intensity_seconds": intensity_seconds["medium"],
+        "high_intensity_seconds": intensity_seconds["high"],
+    }
+
+
+def plan_json_columns(plan_json: dict) -> dict:
+    """The lesson_plans columns derived from a validated plan document (everything except id and user_id)."""
+    return {
+        "theme": plan_json["theme"],
+        "duration_minutes": plan_json["total_duration_minutes"],
+        "plan_json": plan_json,
+        **compute_plan_summary(plan_json),
+    }
+
+
+def plan_columns(plan: LessonPlan) -> dict:
+    """The lesson_plans columns derived from a plan (everything except id and user_id)."""
+    return plan_json_columns(plan.model_dump())
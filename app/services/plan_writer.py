@@ -0,0 +1,224 @@
+"""
+Write-behind queue for auto-saved plans.
+
+Generated and playlist-derived plans get their ID up front and are returned
+to the user right away; the insert happens in the background:
+- each plan is first spooled to its own file, so it survives a crash or restart
+- a single worker inserts whatever is queued in one multi-row statement
+- failed batches are retried with backoff, then row by row to isolate bad rows
+- inserts skip IDs that already exist, so replaying the spool is safe
+- on startup the spool is replayed; on shutdown the queue is drained (the
+  lifespan calls start() and close())
+
+Plans that aren't written yet are served from memory (get_pending) so the
+user can open a plan before it lands. Before such a plan is changed it is
+written right away (flush), and deleting it drops it from the queue (discard).
+
+Note: The queue is per worker process. Rows that can't be written stay in
+the spool (and in memory) and are retried on the next startup.
+"""
+import asyncio
+import json
+import os
+from pathlib import Path
+
+from fastapi import Request
+
+from app.config import get_settings
+from app.services import metrics
+from app.services.plan_repository import PlanRepository
+
+# Backoff before the first retry of a failed batch (doubles on each retry)
+RETRY_BASE_DELAY_SECONDS = 0.5
+
+# Marks the end of the queue on shutdown
+_STOP = object()
+
+
+class PlanWriteQueue:
+    """Background, batched, spool-backed inserts of lesson plans."""
+
+    def __init__(
+        self,
+        repository: PlanRepository,
+        spool_dir: str,
+        batch_size: int = 50,
+        max_retries: int = 5,
+        drain_timeout_seconds: float = 10.0,
+    ):
+        self._repository = repository
+        self._spool_dir = Path(spool_dir)
+        self._batch_size = batch_size
+        self._max_retries = max_retries
+        self._drain_timeout_seconds = drain_timeout_seconds
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._pending: dict[str, dict] = {}
+        # Held while rows are inserted or dropped, so a flushed or discarded row is never written twice
+        self._lock = asyncio.Lock()
+        self._worker: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        """Replay plans left in the spool by a previous run, then start writing."""
+        rows = await asyncio.to_thread(self._read_spool)
+        for row in rows:
+            self._pending[row["id"]] = row
+            self._queue.put_nowait(row)
+        if rows:
+            print(f"[plan_writer] Replaying {len(rows)} spooled plans")
+        self._worker = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Write out everything queued, waiting up to the drain timeout."""
+        if not self._worker:
+            return
+        self._queue.put_nowait(_STOP)
+        try:
+            await asyncio.wait_for(self._worker, timeout=self._drain_timeout_seconds)
+        except asyncio.TimeoutError:
+            print(f"[plan_writer] Drain timed out; {len(self._pending)} plans left in the spool")
+
+    async def enqueue(self, row: dict) -> None:
+        """Queue a plan row (with its id and user_id) for insertion. Returns once it is spooled."""
+        await asyncio.to_thread(self._write_spool_file, row)
+        self._pending[row["id"]] = row
+        self._queue.put_nowait(row)
+        metrics.increment("plan_writes_queued_total")
+
+    def get_pending(self, user_id: str, plan_id: str) -> dict | None:
+        """A plan row that is queued but not yet written, if the user has one with this ID."""
+        row = self._pending.get(plan_id)
+        return row if row and row["user_id"] == user_id else None
+
+    async def flush(self, user_id: str, plan_id: str) -> bool:
+        """Write a queued plan now, e.g. before it is updated. Returns whether one was queued."""
+        async with self._lock:
+            row = self.get_pending(user_id, plan_id)
+            if not row:
+                return False
+            await self._repository.insert_plans([row])
+            del self._pending[plan_id]
+            await asyncio.to_thread(self._delete_spool_files, [plan_id])
+        metrics.increment("plan_writes_total")
+        return True
+
+    async def discard(self, user_id: str, plan_id: str) -> bool:
+        """Drop a queued plan that was deleted before it was written. Returns whether one was queued."""
+        async with self._lock:
+            if not self.get_pending(user_id, plan_id):
+                return False
+            del self._pending[plan_id]
+            await asyncio.to_thread(self._delete_spool_files, [plan_id])
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            # Batch up whatever is already queued, without waiting for more
+            batch = [await self._queue.get()]
+            while len(batch) < self._batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            stopping = any(row is _STOP for row in batch)
+            rows = [row for row in batch if row is not _STOP]
+            if rows:
+                try:
+                    await self._write(rows)
+                except Exception as e:
+                    print(f"[plan_writer] Unexpected error writing plans (left in spool): {e}")
+            if stopping:
+                # Anything queued after the stop marker still gets written
+                if self._queue.empty():
+                    return
+                self._queue.put_nowait(_STOP)
+
+    async def _write(self, rows: list[dict]) -> None:
+        written = await self._insert_with_retry(rows)
+        if written is None:
+            # Find the rows that can't be written, write the rest
+            written = []
+            for row in rows:
+                try:
+                    written.extend(await self._insert_pending([row]))
+                except Exception as e:
+                    # Still served from memory; the user already has its ID
+                    metrics.increment("plan_write_failures_total")
+                    print(f"[plan_writer] Failed to save plan {row['id']}, left in spool: {e}")
+
+        metrics.increment("plan_writes_total", len(written))
+        await asyncio.to_thread(self._delete_spool_files, [row["id"] for row in written])
+
+    async def _insert_with_retry(self, rows: list[dict]) -> list[dict] | None:
+        """Insert a batch, retrying with backoff. Returns the rows written, or None if it kept failing."""
+        for attempt in range(self._max_retries + 1):
+            try:
+                return await self._insert_pending(rows)
+            except Exception as e:
+                if attempt == self._max_retries:
+                    print(f"[plan_writer] Batch of {len(rows)} plans failed after {attempt + 1} attempts: {e}")
+                    return None
+                metrics.increment("plan_write_retries_total")
+                await asyncio.sleep(RETRY_BASE_DELAY_SECONDS * 2 ** attempt)
+        return None
+
+    async def _insert_pending(self, rows: list[dict]) -> list[dict]:
+        """Insert the rows that are still pending (not flushed or discarded meanwhile). Returns them."""
+        async with self._lock:
+            rows = [row for row in rows if self._pending.get(row["id"]) is row]
+            if rows:
+                await self._repository.insert_plans(rows)
+                for row in rows:
+                    del self._pending[row["id"]]
+            return rows
+
+    def _spool_path(self, plan_id: str) -> Path:
+        return self._spool_dir / f"{plan_id}.json"
+
+    def _write_spool_file(self, row: dict) -> None:
+        self._spool_dir.mkdir(parents=True, exist_ok=True)
+        path = self._spool_path(row["id"])
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(row, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _delete_spool_files(self, plan_ids: list[str]) -> None:
+        for plan_id in plan_ids:
+            self._spool_path(plan_id).unlink(missing_ok=True)
+
+    def _read_spool(self) -> list[dict]:
+        if not self._spool_dir.exists():
+            return []
+        files = []
+        for path in self._spool_dir.glob("*.json"):
+            try:
+                files.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                continue  # Written by another worker in the meantime
+
+        rows = []
+        for _, path in sorted(files):
+            try:
+                rows.append(json.loads(path.read_text()))
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError) as e:
+                print(f"[plan_writer] Skipping unreadable spool file {path.name}: {e}")
+        return rows
+
+
+def create_plan_writer(repository: PlanRepository) -> PlanWriteQueue:
+    """Create the shared plan write queue (owned by the app lifespan)."""
+    settings = get_settings()
+    return PlanWriteQueue(
+        repository,
+        spool_dir=settings.plan_write_spool_dir,
+        batch_size=settings.plan_write_batch_size,
+        max_retries=settings.plan_write_max_retries,
+        drain_timeout_seconds=settings.plan_write_drain_timeout_seconds,
+    )
+
+
+def get_plan_writer(request: Request) -> PlanWriteQueue:
+    """Get the shared plan write queue created in the app lifespan."""
+    return request.app.state.plan_writer
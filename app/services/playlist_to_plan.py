@@ -1,7 +1,17 @@
 """Service to convert a Spotify playlist into a LessonPlan."""
 
-from app.models.schemas import LessonPlan, Segment
-from app.services.spotify import get_playlist_tracks, get_audio_features_batch
+import httpx
+
+from app.config import get_settings
+from app.models.schemas import MAX_THEME_LENGTH, LessonPlan, Segment
+from app.services.cache import LRUCache
+from app.services.spotify import get_playlist_tracks, get_playlist_snapshot_id
+from app.services.supabase import SupabaseClient
+from app.services.track_features import get_audio_features_batch_cached
+
+# Playlist tracks and audio features keyed by (playlist_id, snapshot_id). A snapshot's
+# contents never change, so entries stay valid until evicted.
+_snapshot_cache = LRUCache(max_entries=get_settings().playlist_cache_size)
 
 
 def energy_to_intensity(energy: float) -> str:
@@ -69,7 +79,43 @@ def get_segment_type(index: int, total: int, intensity: str) -> tuple[str, str,
     return choice
 
 
+async def get_playlist_contents(
+    client: SupabaseClient,
+    http_client: httpx.AsyncClient,
+    access_token: str,
+    playlist_id: str,
+) -> tuple[list[dict], dict[str, dict]]:
+    """
+    Get a playlist's tracks and their audio features, served from the snapshot cache
+    when the playlist hasn't changed since it was last fetched.
+
+    The snapshot check is made with the caller's token, so access to the playlist is
+    still verified by Spotify on every call.
+    """
+    snapshot_id = await get_playlist_snapshot_id(http_client, access_token, playlist_id)
+    cache_key = (playlist_id, snapshot_id)
+
+    cached = _snapshot_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # Fetch all tracks from the playlist
+    tracks = await get_playlist_tracks(http_client, access_token, playlist_id)
+
+    # Fetch audio features for all tracks in batch (much faster than individual calls),
+    # reading through the shared cache so only unseen tracks hit Spotify
+    track_ids = [track["id"] for track in tracks]
+    audio_features_map, failed = await get_audio_features_batch_cached(client, http_client, track_ids, access_token)
+
+    # Don't pin an incomplete result to the snapshot; the next call retries the failed tracks
+    if not failed:
+        _snapshot_cache.set(cache_key, (tracks, audio_features_map))
+    return tracks, audio_features_map
+
+
 async def playlist_to_plan(
+    client: SupabaseClient,
+    http_client: httpx.AsyncClient,
     access_token: str,
     playlist_id: str,
     playlist_name: str,
@@ -78,6 +124,8 @@ async def playlist_to_plan(
     Convert a Spotify playlist into a LessonPlan.
 
     Args:
+        client: Supabase client (for the shared audio features cache)
+        http_client: Shared Spotify HTTP client
         access_token: Spotify access token
         playlist_id: Spotify playlist ID
         playlist_name: Name of the playlist (used as theme)
@@ -85,8 +133,7 @@ async def playlist_to_plan(
     Returns:
         LessonPlan with segments created from playlist tracks
     """
-    # Fetch all tracks from the playlist
-    tracks = await get_playlist_tracks(access_token, playlist_id)
+    tracks, audio_features_map = await get_playlist_contents(client, http_client, access_token, playlist_id)
 
     if not tracks:
         raise ValueError("Playlist is empty or contains no playable tracks")
@@ -94,10 +141,6 @@ async def playlist_to_plan(
     if len(tracks) < 3:
         raise ValueError("Playlist must contain at least 3 tracks for a valid workout plan")
 
-    # Fetch audio features for all tracks in batch (much faster than individual calls)
-    track_ids = [track["id"] for track in tracks]
-    audio_features_map = await get_audio_features_batch(track_ids, access_token)
-
     segments = []
     total_tracks = len(tracks)
     total_duration_seconds = 0
@@ -143,7 +186,7 @@ async def playlist_to_plan(
         segments.append(segment)
 
     return LessonPlan(
-        theme=playlist_name,
+        theme=playlist_name[:MAX_THEME_LENGTH],
         total_duration_minutes=(total_duration_seconds + 59) // 60,
         segments=segments,
         notes=f"Created from Spotify playlist: {playlist_name}",
@@ -0,0 +1,98 @@
+"""
+Incremental parser for streamed lesson plan JSON.
+
+The model writes the plan as a single JSON document. Rather than waiting for
+the whole response, SegmentStreamParser scans the text as it arrives and emits
+each entry of the top-level "segments" array as soon as its object closes, so
+work on a segment (e.g. Spotify linking) can start while the rest of the plan
+is still being written.
+"""
+import json
+import logging
+
+from pydantic import ValidationError
+
+from app.models.schemas import Segment
+
+logger = logging.getLogger(__name__)
+
+
+class SegmentStreamParser:
+    """Feed chunks of streamed model output; get back completed Segments."""
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0  # Next index of _buffer to scan
+        self._stack: list[str] = []  # Open containers: "{" or "["
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_key: str | None = None  # Last string seen directly inside the root object
+        self._in_segments = False
+        self._segment_start: int | None = None
+        self.segments_emitted = 0
+
+    def feed(self, chunk: str) -> list[Segment]:
+        """Consume the next chunk of text and return any segments completed by it."""
+        self._buffer += chunk
+        completed = []
+
+        buffer = self._buffer
+        for i in range(self._pos, len(buffer)):
+            char = buffer[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1:
+                        self._last_key = self._decode_string(buffer[self._string_start:i + 1])
+                continue
+
+            if not self._stack and char != "{":
+                # Ignore any preamble (e.g. a markdown fence) before the root object
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char in "{[":
+                if char == "[" and self._stack == ["{"] and self._last_key == "segments":
+                    self._in_segments = True
+                elif char == "{" and self._in_segments and len(self._stack) == 2:
+                    self._segment_start = i
+                self._stack.append(char)
+            elif char in "}]":
+                self._stack.pop()
+                if char == "}" and self._in_segments and len(self._stack) == 2 and self._segment_start is not None:
+                    segment = self._parse_segment(buffer[self._segment_start:i + 1])
+                    if segment:
+                        completed.append(segment)
+                    self._segment_start = None
+                elif char == "]" and self._in_segments and len(self._stack) == 1:
+                    self._in_segments = False
+            elif char == "," and len(self._stack) == 1:
+                self._last_key = None
+
+        self._pos = len(buffer)
+        return completed
+
+    @staticmethod
+    def _decode_string(raw: str) -> str | None:
+        try:
+            return json.loads(raw)
+        except json.JSONDecodeError:
+            return None
+
+    def _parse_segment(self, raw: str) -> Segment | None:
+        try:
+            segment = Segment(**json.loads(raw))
+        except (json.JSONDecodeError, TypeError, ValidationError) as e:
+            # The full-response parse will surface real errors; just don't emit this one early
+            logger.warning(f"Skipping unparseable streamed segment: {e}")
+            return None
+        self.segments_emitted += 1
+        return segment
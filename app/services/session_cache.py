@@ -0,0 +1,45 @@
+"""
+Cache of verified sessions, so a token is only verified once while it is valid.
+
+Maps a hash of the access token (the raw token is never stored) to the user it
+belongs to. Entries expire with the token, capped at SESSION_CACHE_MAX_TTL_SECONDS,
+and are invalidated explicitly on logout.
+
+Note: Uses in-memory storage, so the cache is per worker process.
+"""
+import hashlib
+import time
+
+from app.config import get_settings
+from app.services import metrics
+from app.services.cache import LRUCache
+
+_sessions = LRUCache(max_entries=get_settings().session_cache_size)
+
+
+def _token_key(access_token: str) -> str:
+    return hashlib.sha256(access_token.encode()).hexdigest()
+
+
+def get_cached_session(access_token: str) -> dict | None:
+    """Get the cached session ({"user_id", "email"}) for an access token, if any."""
+    session = _sessions.get(_token_key(access_token))
+    metrics.increment("session_cache_hits_total" if session else "session_cache_misses_total")
+    return session
+
+
+def cache_session(access_token: str, user_id: str, email: str | None, expires_at: float | None) -> dict:
+    """Cache a verified session until the token expires (epoch seconds). Returns the session."""
+    session = {"user_id": user_id, "email": email}
+    ttl = get_settings().session_cache_max_ttl_seconds
+    if expires_at is not None:
+        ttl = min(ttl, expires_at - time.time())
+    if ttl > 0:
+        _sessions.set(_token_key(access_token), session, ttl_seconds=ttl)
+    return session
+
+
+def invalidate_session(access_token: str | None) -> None:
+    """Forget a cached session (e.g. on logout)."""
+    if access_token:
+        _sessions.delete(_token_key(access_token))
@@ -0,0 +1,40 @@
+"""
+Coalescing of concurrent identical async calls ("single flight").
+
+Concurrent calls with the same key share one in-flight call and its result.
+A successful result is also reused for a short window afterwards, so requests
+that arrive just after the call finishes don't repeat it.
+
+Note: Coordination is per worker process.
+"""
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any
+
+from app.services.cache import LRUCache
+
+
+class SingleFlight:
+    def __init__(self, reuse_seconds: float, max_entries: int = 10000):
+        self._in_flight: dict[Hashable, asyncio.Task] = {}
+        self._recent = LRUCache(max_entries=max_entries, ttl_seconds=reuse_seconds)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn() unless a call for the same key is in flight or just finished; share its result."""
+        recent = self._recent.get(key)
+        if recent is not None:
+            return recent
+
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+
+        # Shield so one waiter being cancelled doesn't cancel the call for everyone else
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        self._in_flight.pop(key, None)
+        if not task.cancelled() and task.exception() is None and task.result() is not None:
+            self._recent.set(key, task.result())
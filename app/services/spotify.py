@@ -1,14 +1,20 @@
+import asyncio
 import base64
 import urllib.parse
 from typing import Optional
 import httpx
+from fastapi import Request
 
 from app.config import get_settings
+from app.services.spotify_rate_limit import RateLimitedTransport, TokenBucket
 
 SPOTIFY_AUTH_URL = "https://accounts.spotify.com/authorize"
 SPOTIFY_TOKEN_URL = "https://accounts.spotify.com/api/token"
 SPOTIFY_API_URL = "https://api.spotify.com/v1"
 
+# Max concurrent page requests when fetching a paged collection (playlists, playlist tracks)
+PAGE_FETCH_CONCURRENCY = 4
+
 SCOPES = [
     "streaming",
     "user-read-email",
@@ -21,6 +27,33 @@ SCOPES = [
 ]
 
 
+def create_spotify_http_client() -> httpx.AsyncClient:
+    """Create the shared, pooled, rate-limited HTTP client for Spotify (owned by the app lifespan)."""
+    settings = get_settings()
+    transport = httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=settings.spotify_max_connections,
+            max_keepalive_connections=settings.spotify_max_keepalive_connections,
+            keepalive_expiry=settings.http_keepalive_expiry_seconds,
+        ),
+    )
+    return httpx.AsyncClient(
+        transport=RateLimitedTransport(
+            transport,
+            TokenBucket(rate=settings.spotify_requests_per_second, capacity=settings.spotify_burst_size),
+            max_retries=settings.spotify_max_retries,
+            max_retry_wait_seconds=settings.spotify_max_retry_wait_seconds,
+        ),
+        timeout=httpx.Timeout(settings.spotify_timeout_seconds, connect=settings.http_connect_timeout_seconds),
+    )
+
+
+def get_spotify_http_client(request: Request) -> httpx.AsyncClient:
+    """Get the shared Spotify HTTP client created in the app lifespan."""
+    return request.app.state.spotify_http_client
+
+
 def get_auth_url(state: str) -> str:
     """Generate Spotify OAuth authorization URL."""
     settings = get_settings()
@@ -34,7 +67,7 @@ def get_auth_url(state: str) -> str:
     return f"{SPOTIFY_AUTH_URL}?{urllib.parse.urlencode(params)}"
 
 
-async def exchange_code(code: str) -> dict:
+async def exchange_code(http_client: httpx.AsyncClient, code: str) -> dict:
     """Exchange authorization code for access token."""
     settings = get_settings()
 
@@ -42,24 +75,23 @@ async def exchange_code(code: str) -> dict:
         f"{settings.spotify_client_id}:{settings.spotify_client_secret}".encode()
     ).decode()
 
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            SPOTIFY_TOKEN_URL,
-            headers={
-                "Authorization": f"Basic {auth_header}",
-                "Content-Type": "application/x-www-form-urlencoded",
-            },
-            data={
-                "grant_type": "authorization_code",
-                "code": code,
-                "redirect_uri": settings.spotify_redirect_uri,
-            },
-        )
-        response.raise_for_status()
-        return response.json()
-
-
-async def refresh_access_token(refresh_token: str) -> dict:
+    response = await http_client.post(
+        SPOTIFY_TOKEN_URL,
+        headers={
+            "Authorization": f"Basic {auth_header}",
+            "Content-Type": "application/x-www-form-urlencoded",
+        },
+        data={
+            "grant_type": "authorization_code",
+            "code": code,
+            "redirect_uri": settings.spotify_redirect_uri,
+        },
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+async def refresh_access_token(http_client: httpx.AsyncClient, refresh_token: str) -> dict:
     """Refresh an expired access token."""
     settings = get_settings()
 
@@ -67,211 +99,261 @@ async def refresh_access_token(refresh_token: str) -> dict:
         f"{settings.spotify_client_id}:{settings.spotify_client_secret}".encode()
     ).decode()
 
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            SPOTIFY_TOKEN_URL,
-            headers={
-                "Authorization": f"Basic {auth_header}",
-                "Content-Type": "application/x-www-form-urlencoded",
-            },
-            data={
-                "grant_type": "refresh_token",
-                "refresh_token": refresh_token,
-            },
-        )
-        response.raise_for_status()
-        return response.json()
-
-
-async def search_tracks(query: str, access_token: str, limit: int = 10) -> dict:
+    response = await http_client.post(
+        SPOTIFY_TOKEN_URL,
+        headers={
+            "Authorization": f"Basic {auth_header}",
+            "Content-Type": "application/x-www-form-urlencoded",
+        },
+        data={
+            "grant_type": "refresh_token",
+            "refresh_token": refresh_token,
+        },
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+async def search_tracks(http_client: httpx.AsyncClient, query: str, access_token: str, limit: int = 10) -> dict:
     """Search for tracks on Spotify."""
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{SPOTIFY_API_URL}/search",
-            headers={"Authorization": f"Bearer {access_token}"},
-            params={
-                "q": query,
-                "type": "track",
-                "limit": limit,
-            },
-        )
-        response.raise_for_status()
-        return response.json()
+    response = await http_client.get(
+        f"{SPOTIFY_API_URL}/search",
+        headers={"Authorization": f"Bearer {access_token}"},
+        params={
+            "q": query,
+            "type": "track",
+            "limit": limit,
+        },
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+async def get_track(http_client: httpx.AsyncClient, track_id: str, access_token: str) -> dict:
+    """Get track details."""
+    response = await http_client.get(
+        f"{SPOTIFY_API_URL}/tracks/{track_id}",
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    response.raise_for_status()
+    return response.json()
 
 
-async def get_track(track_id: str, access_token: str) -> dict:
-    """Get track details."""
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{SPOTIFY_API_URL}/tracks/{track_id}",
+async def get_tracks_batch(
+    http_client: httpx.AsyncClient,
+    track_ids: list[str],
+    access_token: str,
+) -> dict[str, dict]:
+    """Get track details for multiple tracks (max 50 per request)."""
+    results = {}
+    # Process in batches of 50 (Spotify limit)
+    for i in range(0, len(track_ids), 50):
+        batch = track_ids[i:i + 50]
+        response = await http_client.get(
+            f"{SPOTIFY_API_URL}/tracks",
             headers={"Authorization": f"Bearer {access_token}"},
+            params={"ids": ",".join(batch)},
         )
         response.raise_for_status()
-        return response.json()
+        for track in response.json().get("tracks", []):
+            if track and track.get("id"):
+                results[track["id"]] = track
+
+    return results
 
 
-async def get_user_profile(access_token: str) -> dict:
+async def get_user_profile(http_client: httpx.AsyncClient, access_token: str) -> dict:
     """Get current user's Spotify profile."""
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{SPOTIFY_API_URL}/me",
-            headers={"Authorization": f"Bearer {access_token}"},
-        )
-        response.raise_for_status()
-        return response.json()
+    response = await http_client.get(
+        f"{SPOTIFY_API_URL}/me",
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    response.raise_for_status()
+    return response.json()
 
 
-async def get_audio_features(track_id: str, access_token: str) -> dict | None:
+async def get_audio_features(http_client: httpx.AsyncClient, track_id: str, access_token: str) -> dict | None:
     """Get audio features (tempo, energy, etc.) for a track."""
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{SPOTIFY_API_URL}/audio-features/{track_id}",
-            headers={"Authorization": f"Bearer {access_token}"},
-        )
-        if response.status_code == 200:
-            data = response.json()
-            if data and data.get("tempo"):
-                print(f"[spotify] Audio features for {track_id}: tempo={data.get('tempo')}")
-                return data
-            print(f"[spotify] Audio features empty for {track_id}")
-            return None
-        print(f"[spotify] Audio features failed for {track_id}: {response.status_code}")
+    response = await http_client.get(
+        f"{SPOTIFY_API_URL}/audio-features/{track_id}",
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    if response.status_code == 200:
+        data = response.json()
+        if data and data.get("tempo"):
+            print(f"[spotify] Audio features for {track_id}: tempo={data.get('tempo')}")
+            return data
+        print(f"[spotify] Audio features empty for {track_id}")
         return None
+    print(f"[spotify] Audio features failed for {track_id}: {response.status_code}")
+    return None
 
 
-async def get_audio_features_batch(track_ids: list[str], access_token: str) -> dict[str, dict]:
-    """Get audio features for multiple tracks in one request (max 100)."""
+async def get_audio_features_batch(
+    http_client: httpx.AsyncClient,
+    track_ids: list[str],
+    access_token: str,
+) -> tuple[dict[str, dict], list[str]]:
+    """
+    Get audio features for multiple tracks in one request (max 100).
+
+    Returns (features by track ID, IDs whose request failed, e.g. rate limited).
+    Tracks missing from the first without being in the second have no features.
+    """
     if not track_ids:
-        return {}
+        return {}, []
 
     results = {}
-    async with httpx.AsyncClient() as client:
-        # Process in batches of 100 (Spotify limit)
-        for i in range(0, len(track_ids), 100):
-            batch = track_ids[i:i + 100]
-            try:
-                response = await client.get(
-                    f"{SPOTIFY_API_URL}/audio-features",
-                    headers={"Authorization": f"Bearer {access_token}"},
-                    params={"ids": ",".join(batch)},
-                )
-                if response.status_code == 200:
-                    data = response.json()
-                    for feature in data.get("audio_features", []):
-                        if feature and feature.get("id"):
-                            results[feature["id"]] = feature
-            except Exception as e:
-                print(f"[spotify] Batch audio features failed: {e}")
+    failed = []
+    # Process in batches of 100 (Spotify limit)
+    for i in range(0, len(track_ids), 100):
+        batch = track_ids[i:i + 100]
+        try:
+            response = await http_client.get(
+                f"{SPOTIFY_API_URL}/audio-features",
+                headers={"Authorization": f"Bearer {access_token}"},
+                params={"ids": ",".join(batch)},
+            )
+            if response.status_code == 200:
+                data = response.json()
+                for feature in data.get("audio_features", []):
+                    if feature and feature.get("id"):
+                        results[feature["id"]] = feature
+            else:
+                print(f"[spotify] Batch audio features failed: {response.status_code}")
+                failed.extend(batch)
+        except Exception as e:
+            print(f"[spotify] Batch audio features failed: {e}")
+            failed.extend(batch)
 
-    return results
+    return results, failed
 
 
 async def create_playlist(
+    http_client: httpx.AsyncClient,
     access_token: str,
     name: str,
     description: str = "",
     public: bool = False,
 ) -> dict:
     """Create a new playlist for the current user."""
-    profile = await get_user_profile(access_token)
+    profile = await get_user_profile(http_client, access_token)
     user_id = profile["id"]
 
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            f"{SPOTIFY_API_URL}/users/{user_id}/playlists",
-            headers={
-                "Authorization": f"Bearer {access_token}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "name": name,
-                "description": description,
-                "public": public,
-            },
-        )
-        response.raise_for_status()
-        return response.json()
+    response = await http_client.post(
+        f"{SPOTIFY_API_URL}/users/{user_id}/playlists",
+        headers={
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json",
+        },
+        json={
+            "name": name,
+            "description": description,
+            "public": public,
+        },
+    )
+    response.raise_for_status()
+    return response.json()
 
 
 async def add_tracks_to_playlist(
+    http_client: httpx.AsyncClient,
     access_token: str,
     playlist_id: str,
     track_uris: list[str],
 ) -> dict:
     """Add tracks to a playlist."""
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            f"{SPOTIFY_API_URL}/playlists/{playlist_id}/tracks",
-            headers={
-                "Authorization": f"Bearer {access_token}",
-                "Content-Type": "application/json",
-            },
-            json={"uris": track_uris},
-        )
+    response = await http_client.post(
+        f"{SPOTIFY_API_URL}/playlists/{playlist_id}/tracks",
+        headers={
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json",
+        },
+        json={"uris": track_uris},
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+async def _get_all_pages(
+    http_client: httpx.AsyncClient,
+    url: str,
+    access_token: str,
+    page_size: int,
+) -> list[dict]:
+    """
+    Fetch every item of a paged Spotify collection.
+
+    Reads `total` from the first page, then fetches the remaining offsets
+    concurrently (bounded) and returns the items in their original order.
+    """
+    semaphore = asyncio.Semaphore(PAGE_FETCH_CONCURRENCY)
+
+    async def fetch_page(offset: int) -> dict:
+        async with semaphore:
+            response = await http_client.get(
+                url,
+                headers={"Authorization": f"Bearer {access_token}"},
+                params={"limit": page_size, "offset": offset},
+            )
         response.raise_for_status()
         return response.json()
 
+    first_page = await fetch_page(0)
+    total = first_page.get("total") or 0
+    remaining_pages = await asyncio.gather(
+        *(fetch_page(offset) for offset in range(page_size, total, page_size))
+    )
 
-async def get_user_playlists(access_token: str, limit: int = 50) -> list[dict]:
+    items = []
+    for page in [first_page, *remaining_pages]:
+        items.extend(page.get("items", []))
+    return items
+
+
+async def get_user_playlists(http_client: httpx.AsyncClient, access_token: str, limit: int = 50) -> list[dict]:
     """Get current user's playlists."""
-    playlists = []
-    async with httpx.AsyncClient() as client:
-        url = f"{SPOTIFY_API_URL}/me/playlists"
-        params = {"limit": limit}
+    items = await _get_all_pages(http_client, f"{SPOTIFY_API_URL}/me/playlists", access_token, limit)
 
-        while url:
-            response = await client.get(
-                url,
-                headers={"Authorization": f"Bearer {access_token}"},
-                params=params if "api.spotify.com" in url else None,
-            )
-            response.raise_for_status()
-            data = response.json()
-
-            for item in data.get("items", []):
-                images = item.get("images") or []
-                playlists.append({
-                    "id": item["id"],
-                    "name": item["name"],
-                    "image": images[0]["url"] if images else None,
-                    "track_count": item["tracks"]["total"],
-                    "owner": item["owner"]["display_name"],
-                })
-
-            url = data.get("next")
-            params = None  # Next URL includes params
+    playlists = []
+    for item in items:
+        images = item.get("images") or []
+        playlists.append({
+            "id": item["id"],
+            "name": item["name"],
+            "image": images[0]["url"] if images else None,
+            "track_count": item["tracks"]["total"],
+            "owner": item["owner"]["display_name"],
+        })
 
     return playlists
 
 
-async def get_playlist_tracks(access_token: str, playlist_id: str) -> list[dict]:
+async def get_playlist_snapshot_id(http_client: httpx.AsyncClient, access_token: str, playlist_id: str) -> str:
+    """Get a playlist's current snapshot ID (changes whenever the playlist's contents change)."""
+    response = await http_client.get(
+        f"{SPOTIFY_API_URL}/playlists/{playlist_id}",
+        headers={"Authorization": f"Bearer {access_token}"},
+        params={"fields": "snapshot_id"},
+    )
+    response.raise_for_status()
+    return response.json()["snapshot_id"]
+
+
+async def get_playlist_tracks(http_client: httpx.AsyncClient, access_token: str, playlist_id: str) -> list[dict]:
     """Get all tracks from a playlist."""
-    tracks = []
-    async with httpx.AsyncClient() as client:
-        url = f"{SPOTIFY_API_URL}/playlists/{playlist_id}/tracks"
-        params = {"limit": 100}
+    items = await _get_all_pages(http_client, f"{SPOTIFY_API_URL}/playlists/{playlist_id}/tracks", access_token, 100)
 
-        while url:
-            response = await client.get(
-                url,
-                headers={"Authorization": f"Bearer {access_token}"},
-                params=params if "api.spotify.com" in url else None,
-            )
-            response.raise_for_status()
-            data = response.json()
-
-            for item in data.get("items", []):
-                track = item.get("track")
-                if track and track.get("id"):  # Skip local files
-                    tracks.append({
-                        "id": track["id"],
-                        "uri": track["uri"],
-                        "name": track["name"],
-                        "artist": track["artists"][0]["name"] if track.get("artists") else "",
-                        "duration_ms": track.get("duration_ms", 0),
-                    })
-
-            url = data.get("next")
-            params = None
+    tracks = []
+    for item in items:
+        track = item.get("track")
+        if track and track.get("id"):  # Skip local files
+            tracks.append({
+                "id": track["id"],
+                "uri": track["uri"],
+                "name": track["name"],
+                "artist": track["artists"][0]["name"] if track.get("artists") else "",
+                "duration_ms": track.get("duration_ms", 0),
+            })
 
     return tracks
@@ -0,0 +1,118 @@
+"""
+Rate limiting for Spotify API calls.
+
+All Spotify requests go through RateLimitedTransport, which:
+- draws from a token bucket sized to our Spotify app quota before every request
+- on HTTP 429, honours Retry-After (plus jitter) and retries, pausing the whole
+  bucket so other in-flight calls back off too
+- counts throttled calls and retries in app.services.metrics
+
+Note: The bucket is per worker process, so size it to the app quota divided by
+the number of workers.
+"""
+import asyncio
+import random
+import time
+
+import httpx
+from fastapi import HTTPException
+
+from app.services import metrics
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, up to `capacity` saved for bursts."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Stop handing out tokens for the given number of seconds."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class RateLimitedTransport(httpx.AsyncBaseTransport):
+    """httpx transport that rate-limits requests and retries HTTP 429 responses."""
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        bucket: TokenBucket,
+        max_retries: int = 3,
+        max_retry_wait_seconds: float = 30.0,
+        backoff_base_seconds: float = 0.5,
+    ):
+        self._transport = transport
+        self._bucket = bucket
+        self._max_retries = max_retries
+        self._max_retry_wait_seconds = max_retry_wait_seconds
+        self._backoff_base_seconds = backoff_base_seconds
+
+    def _retry_delay(self, response: httpx.Response, attempt: int) -> float:
+        """Seconds to wait before retrying: Retry-After if given, else exponential backoff, plus jitter."""
+        retry_after = response.headers.get("Retry-After")
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = self._backoff_base_seconds * 2 ** attempt
+        return delay + random.uniform(0, self._backoff_base_seconds)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        attempt = 0
+        while True:
+            await self._bucket.acquire()
+            response = await self._transport.handle_async_request(request)
+            if response.status_code != 429:
+                return response
+
+            metrics.increment("spotify_throttled_total")
+            delay = self._retry_delay(response, attempt)
+            if attempt >= self._max_retries or delay > self._max_retry_wait_seconds:
+                # Give up and let the caller surface the 429
+                print(f"[spotify] Rate limited on {request.url.path}, not retrying (Retry-After: {delay:.1f}s)")
+                return response
+
+            await response.aclose()
+            self._bucket.pause(delay)
+            metrics.increment("spotify_retries_total")
+            metrics.increment("spotify_retry_wait_seconds_total", delay)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def spotify_http_exception(error: Exception, status_code: int, detail: str) -> HTTPException:
+    """
+    Build the HTTPException for a failed Spotify call. Throttling we gave up
+    retrying is passed through as a 429 with Retry-After instead of a generic error.
+    """
+    if isinstance(error, httpx.HTTPStatusError) and error.response.status_code == 429:
+        retry_after = error.response.headers.get("Retry-After")
+        return HTTPException(
+            status_code=429,
+            detail="Spotify is busy right now. Please try again shortly.",
+            headers={"Retry-After": retry_after} if retry_after else None,
+        )
+    return HTTPException(status_code=status_code, detail=f"{detail}: {str(error)}")
@@ -1,14 +1,55 @@
-from supabase import create_client, Client
-from functools import lru_cache
+from fastapi import Request
+from supabase import acreate_client, AsyncClient, AsyncClientOptions
+from supabase_auth import AsyncGoTrueClient
 
 from app.config import get_settings
 
-# Type alias for clarity
-SupabaseClient = Client
+# Type aliases for clarity
+SupabaseClient = AsyncClient
+SupabaseAuthClient = AsyncGoTrueClient
 
 
-@lru_cache
-def get_supabase_client() -> SupabaseClient:
-    """Get a cached Supabase client instance."""
+async def create_supabase_client() -> SupabaseClient:
+    """
+    Create the shared async Supabase data client (owned by the app lifespan).
+
+    Only used for database (PostgREST/RPC) calls, always with the project key.
+    Never sign in or refresh sessions through it: the Supabase client switches
+    its Authorization header to the user's token on every sign-in or refresh,
+    so every later query on the shared client would run as that user. Auth
+    calls go through the separate client from create_supabase_auth_client().
+    """
+    settings = get_settings()
+    return await acreate_client(
+        settings.supabase_url,
+        settings.supabase_key,
+        options=AsyncClientOptions(auto_refresh_token=False, persist_session=False),
+    )
+
+
+def create_supabase_auth_client() -> SupabaseAuthClient:
+    """
+    Create the shared Supabase Auth client (owned by the app lifespan) for
+    sign-up, sign-in, session refresh, sign-out and admin calls.
+
+    A bare GoTrue client: signing in through it never changes the headers it
+    sends, and nothing relies on the session it keeps in memory (user sessions
+    live in the request cookies, and calls pass tokens explicitly).
+    """
     settings = get_settings()
-    return create_client(settings.supabase_url, settings.supabase_key)
+    return AsyncGoTrueClient(
+        url=f"{settings.supabase_url.rstrip('/')}/auth/v1",
+        headers={"apikey": settings.supabase_key, "Authorization": f"Bearer {settings.supabase_key}"},
+        auto_refresh_token=False,
+        persist_session=False,
+    )
+
+
+def get_supabase_client(request: Request) -> SupabaseClient:
+    """Get the shared Supabase data client created in the app lifespan."""
+    return request.app.state.supabase
+
+
+def get_supabase_auth_client(request: Request) -> SupabaseAuthClient:
+    """Get the shared Supabase Auth client created in the app lifespan."""
+    return request.app.state.supabase_auth
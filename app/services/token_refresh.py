@@ -0,0 +1,42 @@
+"""
+Single-flight refresh of Supabase sessions and Spotify access tokens.
+
+When an access token expires, every in-flight request carrying the same refresh
+token would otherwise refresh independently, causing a refresh storm and races
+on rotated refresh tokens. Refreshes are coalesced per refresh token and the
+result is shared with all waiters and reused for a short window.
+"""
+import hashlib
+
+import httpx
+
+from app.config import get_settings
+from app.services import metrics
+from app.services.single_flight import SingleFlight
+from app.services.spotify import refresh_access_token
+from app.services.supabase import SupabaseAuthClient
+
+_supabase_refreshes = SingleFlight(reuse_seconds=get_settings().token_refresh_reuse_seconds)
+_spotify_refreshes = SingleFlight(reuse_seconds=get_settings().token_refresh_reuse_seconds)
+
+
+def _refresh_key(refresh_token: str) -> str:
+    return hashlib.sha256(refresh_token.encode()).hexdigest()
+
+
+async def refresh_supabase_session(auth_client: SupabaseAuthClient, refresh_token: str):
+    """Refresh a Supabase session, coalescing concurrent refreshes of the same refresh token."""
+    async def refresh():
+        metrics.increment("supabase_session_refreshes_total")
+        return await auth_client.refresh_session(refresh_token)
+
+    return await _supabase_refreshes.do(_refresh_key(refresh_token), refresh)
+
+
+async def refresh_spotify_token(http_client: httpx.AsyncClient, refresh_token: str) -> dict:
+    """Refresh a Spotify access token, coalescing concurrent refreshes of the same refresh token."""
+    async def refresh():
+        metrics.increment("spotify_token_refreshes_total")
+        return await refresh_access_token(http_client, refresh_token)
+
+    return await _spotify_refreshes.do(_refresh_key(refresh_token), refresh)
@@ -0,0 +1,166 @@
+"""
+Local verification of Supabase access tokens.
+
+Access tokens are JWTs signed either with the project's JWT secret (HS256) or
+with an asymmetric key published at the project's JWKS endpoint. Verifying them
+locally avoids a Supabase Auth round trip on every authenticated request; the
+network is only needed to refresh sessions, or when no signing key is available.
+
+The JWKS is cached and refreshed in the background, and re-fetched early
+(at most once per KEY_REFRESH_COOLDOWN_SECONDS) when a token names an unknown key.
+
+A locally verified token stays valid until it expires, so logout revokes its
+session here too: revoked session IDs are rejected until their tokens expire.
+The deny-list is per worker process; Supabase sign-out (done on logout) stops
+the session from being refreshed everywhere.
+"""
+import asyncio
+import time
+
+import httpx
+import jwt
+from fastapi import Request
+
+from app.config import get_settings
+
+# Minimum time between on-demand JWKS fetches triggered by unknown key IDs
+KEY_REFRESH_COOLDOWN_SECONDS = 60
+
+# Tolerated clock skew when checking exp/nbf
+CLOCK_SKEW_SECONDS = 10
+
+
+class SigningKeyUnavailable(Exception):
+    """No key is available to verify a token locally."""
+
+
+class SupabaseTokenVerifier:
+    """Verifies Supabase access tokens against the JWT secret or the project's cached JWKS."""
+
+    def __init__(self, supabase_url: str, api_key: str, jwt_secret: str | None, refresh_interval_seconds: float):
+        self._jwks_url = f"{supabase_url.rstrip('/')}/auth/v1/.well-known/jwks.json"
+        self._api_key = api_key
+        self._jwt_secret = jwt_secret
+        self._refresh_interval_seconds = refresh_interval_seconds
+        self._keys: dict[str, jwt.PyJWK] = {}
+        # Revoked session IDs (or token IDs) -> expiry of the revoked token
+        self._revoked: dict[str, float] = {}
+        self._last_fetch = 0.0
+        self._fetch_lock = asyncio.Lock()
+        self._http_client = httpx.AsyncClient(timeout=5.0)
+        self._refresh_task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        """Load the signing keys and start rotating them in the background."""
+        await self.refresh_keys()
+        self._refresh_task = asyncio.create_task(self._refresh_periodically())
+
+    async def close(self) -> None:
+        if self._refresh_task:
+            self._refresh_task.cancel()
+        await self._http_client.aclose()
+
+    async def _refresh_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self._refresh_interval_seconds)
+            await self.refresh_keys()
+
+    async def refresh_keys(self) -> None:
+        """Fetch the project's JWKS. Keeps the previous keys if the fetch fails."""
+        async with self._fetch_lock:
+            self._last_fetch = time.monotonic()
+            try:
+                response = await self._http_client.get(self._jwks_url, headers={"apikey": self._api_key})
+                response.raise_for_status()
+                keys = {}
+                for key_data in response.json().get("keys", []):
+                    try:
+                        key = jwt.PyJWK(key_data)
+                    except jwt.PyJWKError as e:
+                        print(f"[auth] Skipping unusable JWKS key: {e}")
+                        continue
+                    if key.key_id:
+                        keys[key.key_id] = key
+                self._keys = keys
+            except Exception as e:
+                print(f"[auth] Failed to fetch JWKS: {e}")
+
+    async def _get_signing_key(self, header: dict) -> tuple[object, str]:
+        algorithm = header.get("alg")
+        if algorithm == "HS256":
+            if not self._jwt_secret:
+                raise SigningKeyUnavailable("SUPABASE_JWT_SECRET not configured")
+            return self._jwt_secret, algorithm
+
+        key_id = header.get("kid")
+        key = self._keys.get(key_id)
+        if key is None and time.monotonic() - self._last_fetch > KEY_REFRESH_COOLDOWN_SECONDS:
+            # Key may have just been rotated in
+            await self.refresh_keys()
+            key = self._keys.get(key_id)
+        if key is None:
+            raise SigningKeyUnavailable(f"Unknown signing key: {key_id}")
+        return key.key, key.algorithm_name
+
+    async def verify(self, token: str) -> dict | None:
+        """
+        Verify an access token locally.
+
+        Returns the token's claims if it is valid, or None if it is invalid,
+        expired or revoked. Raises SigningKeyUnavailable if it can't be checked locally.
+        """
+        try:
+            header = jwt.get_unverified_header(token)
+        except jwt.InvalidTokenError:
+            return None
+
+        key, algorithm = await self._get_signing_key(header)
+        try:
+            claims = jwt.decode(
+                token,
+                key,
+                algorithms=[algorithm],
+                audience="authenticated",
+                leeway=CLOCK_SKEW_SECONDS,
+                options={"require": ["exp", "sub"]},
+            )
+        except jwt.InvalidTokenError:
+            return None
+        return None if self._is_revoked(claims) else claims
+
+    def revoke(self, claims: dict) -> None:
+        """Reject tokens of this session (or this token, if it has no session ID) until the token expires."""
+        revocation_id = _revocation_id(claims)
+        if not revocation_id:
+            return
+        now = time.time()
+        self._revoked = {key: exp for key, exp in self._revoked.items() if exp + CLOCK_SKEW_SECONDS > now}
+        self._revoked[revocation_id] = claims["exp"]
+
+    def _is_revoked(self, claims: dict) -> bool:
+        revocation_id = _revocation_id(claims)
+        return revocation_id is not None and revocation_id in self._revoked
+
+
+def _revocation_id(claims: dict) -> str | None:
+    if claims.get("session_id"):
+        return f"session:{claims['session_id']}"
+    if claims.get("jti"):
+        return f"token:{claims['jti']}"
+    return None
+
+
+def create_token_verifier() -> SupabaseTokenVerifier:
+    """Create the shared token verifier (owned by the app lifespan)."""
+    settings = get_settings()
+    return SupabaseTokenVerifier(
+        supabase_url=settings.supabase_url,
+        api_key=settings.supabase_key,
+        jwt_secret=settings.supabase_jwt_secret,
+        refresh_interval_seconds=settings.supabase_jwks_refresh_seconds,
+    )
+
+
+def get_token_verifier(request: Request) -> SupabaseTokenVerifier:
+    """Get the shared token verifier created in the app lifespan."""
+    return request.app.state.token_verifier
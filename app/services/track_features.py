@@ -0,0 +1,291 @@
+"""
+Shared cache of per-track audio features.
+
+Audio features for a Spotify track never change, so every lookup path reads
+through an in-process LRU backed by the `track_features` table and writes new
+results back to both. Each row records which source answered (Spotify or
+GetSongBPM) and when.
+
+GetSongBPM answers come from a search by song name and artist, so they can be
+wrong. They expire after getsongbpm_features_ttl_seconds; the next lookup
+asks Spotify first again, and its answer replaces them.
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+from app.config import get_settings
+from app.services.cache import LRUCache
+from app.services.getsongbpm import search_song_bpm
+from app.services.spotify import get_audio_features, get_audio_features_batch, get_track, get_tracks_batch
+from app.services.supabase import SupabaseClient
+
+SOURCE_SPOTIFY = "spotify"
+SOURCE_GETSONGBPM = "getsongbpm"
+
+# Track IDs per database lookup (keeps the PostgREST query string short)
+DB_LOOKUP_BATCH_SIZE = 100
+
+# Max concurrent GetSongBPM searches for a batch lookup
+GETSONGBPM_CONCURRENCY = 5
+
+# After this many consecutive Spotify misses, stop giving Spotify a head start
+SPOTIFY_MISS_STREAK_LIMIT = 3
+
+_memory_cache = LRUCache(max_entries=get_settings().track_features_cache_size)
+
+_spotify_miss_streak = 0
+
+
+def _ttl_seconds(source: str) -> float | None:
+    """How long features from a source stay cached (None: forever)."""
+    return get_settings().getsongbpm_features_ttl_seconds if source == SOURCE_GETSONGBPM else None
+
+
+def _is_expired(row: dict) -> bool:
+    """Whether a cached track_features row is past its source's TTL."""
+    ttl = _ttl_seconds(row["source"])
+    if ttl is None:
+        return False
+    if not row.get("created_at"):
+        return True
+    age = datetime.now(timezone.utc) - datetime.fromisoformat(row["created_at"])
+    return age > timedelta(seconds=ttl)
+
+
+async def get_cached_features(client: SupabaseClient, track_ids: list[str]) -> dict[str, dict]:
+    """Look up cached features for the given tracks (memory first, then the database)."""
+    results = {}
+    missing = []
+    for track_id in dict.fromkeys(track_ids):
+        features = _memory_cache.get(track_id)
+        if features is not None:
+            results[track_id] = features
+        else:
+            missing.append(track_id)
+
+    for i in range(0, len(missing), DB_LOOKUP_BATCH_SIZE):
+        batch = missing[i:i + DB_LOOKUP_BATCH_SIZE]
+        try:
+            response = await (
+                client.table("track_features")
+                .select("track_id, source, features, created_at")
+                .in_("track_id", batch)
+                .execute()
+            )
+            for row in response.data or []:
+                if _is_expired(row):
+                    continue
+                features = {**row["features"], "source": row["source"]}
+                # Not the full TTL again: the row's age counts
+                ttl = _ttl_seconds(row["source"])
+                if ttl is not None:
+                    cached_at = datetime.fromisoformat(row["created_at"])
+                    ttl -= (datetime.now(timezone.utc) - cached_at).total_seconds()
+                _memory_cache.set(row["track_id"], features, ttl_seconds=ttl)
+                results[row["track_id"]] = features
+        except Exception as e:
+            print(f"[track_features] Cache read failed: {e}")
+
+    return results
+
+
+async def store_features(client: SupabaseClient, features_by_id: dict[str, dict], source: str) -> dict[str, dict]:
+    """
+    Write newly fetched features back to the memory cache and the database.
+
+    Returns the features tagged with their source, as later cache reads will return them.
+    """
+    if not features_by_id:
+        return {}
+
+    stored = {}
+    rows = []
+    now = datetime.now(timezone.utc).isoformat()
+    for track_id, features in features_by_id.items():
+        features = {**features, "source": source}
+        _memory_cache.set(track_id, features, ttl_seconds=_ttl_seconds(source))
+        stored[track_id] = features
+        rows.append({
+            "track_id": track_id,
+            "source": source,
+            "tempo": features.get("tempo"),
+            "energy": features.get("energy"),
+            "valence": features.get("valence"),
+            "danceability": features.get("danceability"),
+            "features": features,
+            # Replacing an expired row restarts its TTL
+            "created_at": now,
+        })
+
+    try:
+        await client.table("track_features").upsert(rows).execute()
+    except Exception as e:
+        print(f"[track_features] Cache write failed: {e}")
+
+    return stored
+
+
+async def get_audio_features_batch_cached(
+    client: SupabaseClient,
+    http_client: httpx.AsyncClient,
+    track_ids: list[str],
+    access_token: str,
+) -> tuple[dict[str, dict], list[str]]:
+    """
+    Get audio features for many tracks, fetching only cache misses from Spotify.
+
+    Returns (features by track ID, IDs Spotify couldn't be asked about, e.g. rate limited).
+    """
+    results = await get_cached_features(client, track_ids)
+
+    failed = []
+    missing = [track_id for track_id in dict.fromkeys(track_ids) if track_id not in results]
+    if missing:
+        fetched, failed = await get_audio_features_batch(http_client, missing, access_token)
+        results.update(await store_features(client, fetched, SOURCE_SPOTIFY))
+
+    return results, failed
+
+
+async def _search_getsongbpm(
+    getsongbpm_client: httpx.AsyncClient,
+    track: dict,
+    semaphore: asyncio.Semaphore,
+) -> dict | None:
+    song_name = track.get("name", "")
+    artist = track["artists"][0]["name"] if track.get("artists") else ""
+    async with semaphore:
+        return await search_song_bpm(getsongbpm_client, song_name, artist)
+
+
+async def resolve_audio_features_batch(
+    client: SupabaseClient,
+    http_client: httpx.AsyncClient,
+    getsongbpm_client: httpx.AsyncClient,
+    track_ids: list[str],
+    access_token: str,
+) -> dict[str, dict]:
+    """
+    Get audio features for many tracks: cache, then one Spotify batch call, then
+    concurrent GetSongBPM lookups for whatever Spotify couldn't answer.
+    """
+    track_ids = list(dict.fromkeys(track_ids))
+    results, _ = await get_audio_features_batch_cached(client, http_client, track_ids, access_token)
+
+    missing = [track_id for track_id in track_ids if track_id not in results]
+    if not missing:
+        return results
+
+    # GetSongBPM searches by name, so look up the missing tracks' details in bulk
+    try:
+        tracks = await get_tracks_batch(http_client, missing, access_token)
+    except Exception as e:
+        print(f"[track_features] Track lookup for GetSongBPM fallback failed: {e}")
+        return results
+
+    semaphore = asyncio.Semaphore(GETSONGBPM_CONCURRENCY)
+    lookup_ids = [track_id for track_id in missing if track_id in tracks]
+    bpm_results = await asyncio.gather(
+        *(_search_getsongbpm(getsongbpm_client, tracks[track_id], semaphore) for track_id in lookup_ids)
+    )
+
+    found = {
+        track_id: bpm_data
+        for track_id, bpm_data in zip(lookup_ids, bpm_results)
+        if bpm_data and bpm_data.get("tempo")
+    }
+    results.update(await store_features(client, found, SOURCE_GETSONGBPM))
+    return results
+
+
+async def _lookup_spotify(http_client: httpx.AsyncClient, track_id: str, access_token: str) -> dict | None:
+    global _spotify_miss_streak
+    try:
+        features = await get_audio_features(http_client, track_id, access_token)
+    except Exception:
+        # Rate limits and timeouts are exactly what the hedge should route around
+        _spotify_miss_streak += 1
+        raise
+    _spotify_miss_streak = 0 if features else _spotify_miss_streak + 1
+    return features
+
+
+async def _lookup_getsongbpm(
+    http_client: httpx.AsyncClient,
+    getsongbpm_client: httpx.AsyncClient,
+    track_id: str,
+    access_token: str,
+) -> dict | None:
+    track = await get_track(http_client, track_id, access_token)
+    song_name = track.get("name", "")
+    artist = track["artists"][0]["name"] if track.get("artists") else ""
+    bpm_data = await search_song_bpm(getsongbpm_client, song_name, artist)
+    return bpm_data if bpm_data and bpm_data.get("tempo") else None
+
+
+async def resolve_audio_features(
+    client: SupabaseClient,
+    http_client: httpx.AsyncClient,
+    getsongbpm_client: httpx.AsyncClient,
+    track_id: str,
+    access_token: str,
+) -> dict | None:
+    """
+    Get audio features for a track within a latency budget.
+
+    Spotify starts first; if it hasn't answered within the hedge delay,
+    GetSongBPM starts in parallel. The first useful answer wins and the loser
+    is cancelled. Returns None if neither source answers within the budget.
+    """
+    settings = get_settings()
+
+    cached = await get_cached_features(client, [track_id])
+    if track_id in cached:
+        return cached[track_id]
+
+    lookups = {
+        SOURCE_SPOTIFY: lambda: _lookup_spotify(http_client, track_id, access_token),
+        SOURCE_GETSONGBPM: lambda: _lookup_getsongbpm(http_client, getsongbpm_client, track_id, access_token),
+    }
+
+    # Skip the head start when Spotify keeps coming back empty (audio features deprecated for this app)
+    hedge_delay = settings.audio_features_hedge_delay_seconds
+    if _spotify_miss_streak >= SPOTIFY_MISS_STREAK_LIMIT:
+        hedge_delay = 0
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.audio_features_budget_seconds
+    tasks = {asyncio.create_task(lookups[SOURCE_SPOTIFY]()): SOURCE_SPOTIFY}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+        if not done or not _task_result(done.pop()):
+            tasks[asyncio.create_task(lookups[SOURCE_GETSONGBPM]())] = SOURCE_GETSONGBPM
+
+        pending = set(tasks)
+        while pending:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                print(f"[track_features] Audio features budget exceeded for {track_id}")
+                return None
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                features = _task_result(task)
+                if features:
+                    stored = await store_features(client, {track_id: features}, tasks[task])
+                    return stored[track_id]
+        return None
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def _task_result(task: asyncio.Task) -> dict | None:
+    """Result of a finished lookup task, treating errors as a miss."""
+    if task.cancelled():
+        return None
+    if task.exception():
+        print(f"[track_features] Lookup failed: {task.exception()}")
+        return None
+    return task.result()
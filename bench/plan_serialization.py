@@ -0,0 +1,133 @@
+"""
+Microbenchmark: serializing plan payloads, FastAPI's default path vs ORJSONResponse.
+
+"jsonable_encoder" is what FastAPI does with a route's return value when it
+isn't a Response (jsonable_encoder, then json.dumps in JSONResponse).
+"orjson" is app.responses.ORJSONResponse, which the plan routes now return
+directly: orjson for dicts, one model_dump_json pass for Pydantic models.
+
+Payloads are built around a 30-segment plan with sub-segments:
+- generate: the /generate response ({"plan": ..., "id": ...})
+- plan model: the LessonPlan model itself
+- plan row: one stored row, as GET /api/plans/{id} returns it
+- list page: 20 summary rows, as GET /api/plans returns them
+
+Run from the repo root with the usual .env in place:
+
+    python -m bench.plan_serialization [--segments 30] [--sub-segments 4]
+"""
+import argparse
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.models.schemas import LessonPlan, Segment, SubSegment
+from app.responses import ORJSONResponse
+from app.services.plan_summary import plan_json_columns
+
+
+def make_plan(segment_count: int, sub_segment_count: int) -> LessonPlan:
+    return LessonPlan(
+        theme="Benchmark Ride",
+        total_duration_minutes=segment_count * 4,
+        notes="Keep the climbs honest.",
+        segments=[
+            Segment(
+                name=f"Segment {i}",
+                duration_seconds=240,
+                intensity=("low", "medium", "high")[i % 3],
+                position="standing" if i % 2 else "seated",
+                description="Build resistance through the chorus, recover on the verse.",
+                suggested_bpm_range="120-130",
+                song=f"Song {i} - Artist {i}",
+                spotify_uri=f"spotify:track:{i:022d}",
+                song_end_seconds=240,
+                sub_segments=[
+                    SubSegment(
+                        name=f"Interval {j}",
+                        duration_seconds=60,
+                        intensity="high" if j % 2 else "medium",
+                        position="standing",
+                        description="Out of the saddle, push the pace.",
+                        suggested_bpm_range="125-135",
+                    )
+                    for j in range(sub_segment_count)
+                ],
+            )
+            for i in range(segment_count)
+        ],
+    )
+
+
+def make_payloads(plan: LessonPlan) -> dict:
+    plan_json = plan.model_dump()
+    now = datetime.now(timezone.utc)
+    row = {
+        "id": str(uuid.uuid4()),
+        "user_id": "bench-user",
+        **plan_json_columns(plan_json),
+        "created_at": now.isoformat(),
+        "updated_at": now.isoformat(),
+    }
+    summary = {key: value for key, value in row.items() if key not in ("user_id", "plan_json")}
+    page = [
+        {**summary, "id": str(uuid.uuid4()), "created_at": (now - timedelta(hours=i)).isoformat()}
+        for i in range(20)
+    ]
+    return {
+        "generate": {"plan": plan_json, "id": row["id"]},
+        "plan model": plan,
+        "plan row": row,
+        "list page": {"plans": page, "next_cursor": "bench"},
+    }
+
+
+def per_call_us(render, content, min_seconds: float = 0.5) -> float:
+    """Best-of-5 time per call in microseconds, each round running for about min_seconds."""
+    render(content)
+    calls = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(calls):
+            render(content)
+        if time.perf_counter() - start >= min_seconds / 5:
+            break
+        calls *= 2
+    best = float("inf")
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(calls):
+            render(content)
+        best = min(best, (time.perf_counter() - start) / calls)
+    return best * 1e6
+
+
+def render_default(content) -> bytes:
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def render_orjson(content) -> bytes:
+    return ORJSONResponse(content).body
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--segments", type=int, default=30)
+    parser.add_argument("--sub-segments", type=int, default=4)
+    args = parser.parse_args()
+
+    plan = make_plan(args.segments, args.sub_segments)
+    print(f"{args.segments} segments x {args.sub_segments} sub-segments")
+    print(f"  {'payload':<12} {'bytes':>8} {'jsonable_encoder':>18} {'orjson':>10} {'speedup':>8}")
+    for name, content in make_payloads(plan).items():
+        size = len(render_orjson(content))
+        before = per_call_us(render_default, content)
+        after = per_call_us(render_orjson, content)
+        print(f"  {name:<12} {size:>8} {before:>15.0f} us {after:>7.0f} us {before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Benchmark: linking a generated plan to Spotify, serial vs concurrent.
+
+Runs against a mocked Spotify that answers every request after a fixed
+latency, and compares:
+- serial: the previous per-segment loop (search, then a single-track audio
+  features call, one segment at a time)
+- concurrent: auto_link_spotify_uris (searches SPOTIFY_SEARCH_CONCURRENCY at a
+  time, then one audio features batch call)
+
+The track features cache is cold on every run. Run from the repo root with the
+usual .env in place (nothing is sent to Spotify or Supabase):
+
+    python -m bench.spotify_linking [--segments 15] [--latency-ms 80] [--runs 5]
+"""
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import io
+import statistics
+import time
+
+import httpx
+
+from app.models.schemas import LessonPlan, Segment
+from app.routers.generate import (
+    SPOTIFY_SEARCH_CONCURRENCY,
+    auto_link_spotify_uris,
+    energy_to_intensity,
+    tempo_to_bpm_range,
+)
+from app.services import track_features
+from app.services.spotify import get_audio_features, search_tracks
+
+
+def _track_id(query: str) -> str:
+    return hashlib.md5(query.encode()).hexdigest()[:22]
+
+
+def _audio_features(track_id: str) -> dict:
+    return {"id": track_id, "tempo": 128.0, "energy": 0.8, "valence": 0.5, "danceability": 0.6}
+
+
+def create_mock_spotify(latency: float) -> tuple[httpx.AsyncClient, list[str]]:
+    """An HTTP client whose Spotify API answers after `latency` seconds; also returns the request log."""
+    requests = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request.url.path)
+        await asyncio.sleep(latency)
+        path = request.url.path
+        if path.endswith("/search"):
+            query = request.url.params["q"]
+            track_id = _track_id(query)
+            return httpx.Response(200, json={"tracks": {"items": [{
+                "id": track_id,
+                "uri": f"spotify:track:{track_id}",
+                "name": query.split(" - ")[0],
+                "artists": [{"name": "Mock Artist"}],
+                "duration_ms": 240_000,
+            }]}})
+        if path.endswith("/audio-features"):
+            ids = request.url.params["ids"].split(",")
+            return httpx.Response(200, json={"audio_features": [_audio_features(track_id) for track_id in ids]})
+        if "/audio-features/" in path:
+            return httpx.Response(200, json=_audio_features(path.rsplit("/", 1)[-1]))
+        return httpx.Response(404)
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler)), requests
+
+
+class ColdFeaturesCache:
+    """Stands in for the Supabase client: the track_features table is always empty."""
+
+    def table(self, name: str) -> "ColdFeaturesCache":
+        return self
+
+    def __getattr__(self, name: str):
+        return lambda *args, **kwargs: self
+
+    async def execute(self):
+        return type("Response", (), {"data": []})()
+
+
+def make_plan(segment_count: int) -> LessonPlan:
+    return LessonPlan(
+        theme="Benchmark Ride",
+        segments=[
+            Segment(
+                name=f"Segment {i}",
+                duration_seconds=240,
+                intensity="medium",
+                position="seated",
+                description="Steady climb",
+                suggested_bpm_range="120-130",
+                song=f"Song {i} - Artist {i}",
+            )
+            for i in range(segment_count)
+        ],
+    )
+
+
+async def link_serially(http_client: httpx.AsyncClient, plan: LessonPlan, spotify_token: str) -> LessonPlan:
+    """The linking loop before concurrent searches and batched audio features."""
+    for segment in plan.segments:
+        results = await search_tracks(http_client, segment.song, spotify_token, limit=1)
+        tracks = results.get("tracks", {}).get("items", [])
+        if not tracks:
+            continue
+        track = tracks[0]
+        segment.spotify_uri = track["uri"]
+        segment.song = f"{track['name']} - {track['artists'][0]['name']}"
+        segment.duration_seconds = track["duration_ms"] // 1000
+        audio_features = await get_audio_features(http_client, track["id"], spotify_token)
+        if audio_features:
+            segment.intensity = energy_to_intensity(audio_features["energy"])
+            segment.suggested_bpm_range = tempo_to_bpm_range(audio_features["tempo"])
+    return plan
+
+
+async def link_concurrently(http_client: httpx.AsyncClient, plan: LessonPlan, spotify_token: str) -> LessonPlan:
+    track_features._memory_cache.clear()
+    return await auto_link_spotify_uris(ColdFeaturesCache(), http_client, plan, spotify_token)
+
+
+async def run(segment_count: int, latency: float, runs: int) -> None:
+    print(
+        f"{segment_count} segments, {latency * 1000:.0f} ms per Spotify request, "
+        f"search concurrency {SPOTIFY_SEARCH_CONCURRENCY}, best of {runs}"
+    )
+    results = {}
+    for name, link in (("serial", link_serially), ("concurrent", link_concurrently)):
+        timings = []
+        for _ in range(runs):
+            http_client, requests = create_mock_spotify(latency)
+            plan = make_plan(segment_count)
+            # The service logs every audio features call
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                plan = await link(http_client, plan, "token")
+                timings.append(time.perf_counter() - start)
+            await http_client.aclose()
+            assert all(segment.spotify_uri for segment in plan.segments)
+            assert all(segment.intensity == "high" for segment in plan.segments)
+        results[name] = min(timings)
+        print(
+            f"  {name:<11} {min(timings) * 1000:8.1f} ms best  {statistics.median(timings) * 1000:8.1f} ms median  "
+            f"{len(requests):3d} requests"
+        )
+    print(f"  speedup     {results['serial'] / results['concurrent']:8.1f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--segments", type=int, default=15)
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.segments, args.latency_ms / 1000, args.runs))
+
+
+if __name__ == "__main__":
+    main()
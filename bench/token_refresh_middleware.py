@@ -0,0 +1,120 @@
+"""
+Benchmark: requests per second through TokenRefreshMiddleware, before and after.
+
+Compares the previous BaseHTTPMiddleware implementation (copied below as
+LegacyTokenRefreshMiddleware) with the pure ASGI one in app.middleware, on
+/health and a /static file. Each app matches main.py's stack: CORS, token
+refresh, the static mount and the health route. Requests go in-process
+through httpx's ASGI transport, so the numbers measure app overhead only.
+
+Run from the repo root with the usual .env in place:
+
+    python -m bench.token_refresh_middleware [--requests 3000] [--concurrency 20]
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.staticfiles import StaticFiles
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.middleware import TokenRefreshMiddleware
+
+PATHS = ("/health", "/static/favicon.svg")
+
+
+class LegacyTokenRefreshMiddleware(BaseHTTPMiddleware):
+    """TokenRefreshMiddleware as it was before the pure ASGI rewrite."""
+
+    async def dispatch(self, request: Request, call_next):
+        request.state.new_access_token = None
+        request.state.new_refresh_token = None
+        request.state.token_expires_in = None
+
+        response = await call_next(request)
+
+        if hasattr(request.state, 'new_access_token') and request.state.new_access_token:
+            response.set_cookie(
+                key="access_token",
+                value=request.state.new_access_token,
+                httponly=True,
+                max_age=request.state.token_expires_in or 3600,
+                samesite="lax"
+            )
+            if request.state.new_refresh_token:
+                response.set_cookie(
+                    key="refresh_token",
+                    value=request.state.new_refresh_token,
+                    httponly=True,
+                    max_age=60 * 60 * 24 * 30,
+                    samesite="lax"
+                )
+
+        return response
+
+
+def create_app(middleware_class: type) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["http://localhost:8000"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.add_middleware(middleware_class)
+    app.mount("/static", StaticFiles(directory="app/static"), name="static")
+
+    @app.get("/health")
+    async def health_check():
+        return {"status": "healthy"}
+
+    return app
+
+
+async def requests_per_second(app: FastAPI, path: str, total: int, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # Warm up (route matching caches, file stat)
+        for _ in range(50):
+            (await client.get(path)).raise_for_status()
+
+        async def worker(count: int) -> None:
+            for _ in range(count):
+                (await client.get(path)).raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(total // concurrency) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return (total // concurrency) * concurrency / elapsed
+
+
+async def run(total: int, concurrency: int, rounds: int) -> None:
+    apps = {
+        "BaseHTTPMiddleware": create_app(LegacyTokenRefreshMiddleware),
+        "pure ASGI": create_app(TokenRefreshMiddleware),
+    }
+    print(f"{total} requests per round, {concurrency} concurrent, best of {rounds}")
+    for path in PATHS:
+        results = {}
+        for name, app in apps.items():
+            results[name] = max([await requests_per_second(app, path, total, concurrency) for _ in range(rounds)])
+            print(f"  {path:<20} {name:<20} {results[name]:8.0f} req/s")
+        before, after = results.values()
+        print(f"  {path:<20} {'change':<20} {(after / before - 1) * 100:+7.0f}%")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.concurrency, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,15 @@ from fastapi.templating import Jinja2Templates
 from app.config import get_settings
 from app.routers import auth, generate, plans, spotify
 from app.middleware import TokenRefreshMiddleware
+from app.models.database import create_async_db_engine
+from app.services.ai import create_anthropic_client
+from app.services.metrics import get_metrics
+from app.services.plan_repository import BACKEND_POSTGRES, create_plan_repository
+from app.services.plan_writer import create_plan_writer
+from app.services.getsongbpm import create_getsongbpm_http_client
+from app.services.spotify import create_spotify_http_client
+from app.services.supabase import create_supabase_auth_client, create_supabase_client
+from app.services.token_verifier import create_token_verifier
 
 
 @asynccontextmanager
@@ -15,9 +24,30 @@ async def lifespan(app: FastAPI):
     # Startup
     settings = get_settings()
     print(f"Starting Cycle Planner in {settings.app_env} mode")
+    app.state.supabase = await create_supabase_client()
+    app.state.supabase_auth = create_supabase_auth_client()
+    app.state.db_engine = create_async_db_engine() if settings.plans_backend == BACKEND_POSTGRES else None
+    app.state.plan_repository = create_plan_repository(app.state.supabase, app.state.db_engine)
+    app.state.plan_writer = create_plan_writer(app.state.plan_repository)
+    await app.state.plan_writer.start()
+    app.state.anthropic_client = create_anthropic_client()
+    app.state.spotify_http_client = create_spotify_http_client()
+    app.state.getsongbpm_http_client = create_getsongbpm_http_client()
+    app.state.token_verifier = create_token_verifier()
+    await app.state.token_verifier.start()
     yield
     # Shutdown
     print("Shutting down Cycle Planner")
+    # Drain queued plan writes while the database clients are still open
+    await app.state.plan_writer.close()
+    await app.state.anthropic_client.close()
+    await app.state.spotify_http_client.aclose()
+    await app.state.getsongbpm_http_client.aclose()
+    await app.state.token_verifier.close()
+    await app.state.supabase.postgrest.aclose()
+    await app.state.supabase_auth.close()
+    if app.state.db_engine is not None:
+        await app.state.db_engine.dispose()
 
 
 app = FastAPI(
@@ -57,6 +87,15 @@ async def health_check():
     return {"status": "healthy"}
 
 
+async def metrics_snapshot():
+    return get_metrics()
+
+
+# Internal upstream and traffic details, so only served when enabled (keep it off the public internet)
+if settings.metrics_enabled:
+    app.add_api_route("/metrics", metrics_snapshot, methods=["GET"], include_in_schema=False)
+
+
 # Page routes
 from fastapi import Request
 
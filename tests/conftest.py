@@ -0,0 +1,145 @@
+"""
+Shared fixtures: the app with auth, plan storage and the plan write queue
+swapped for in-memory versions.
+
+Settings are read at import time, so placeholder values are set first; tests
+never reach Anthropic, Supabase or Spotify.
+"""
+import os
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "test")
+os.environ.setdefault("SUPABASE_URL", "https://supabase.invalid")
+os.environ.setdefault("SUPABASE_KEY", "test")
+
+import copy
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.dependencies import get_current_user_id
+from app.services.plan_repository import PLAN_SUMMARY_COLUMNS, PlanRepository, get_plan_repository
+from app.services.plan_summary import plan_json_columns
+from app.services.plan_writer import PlanWriteQueue, get_plan_writer
+
+USER_ID = "test-user"
+
+
+class InMemoryPlanRepository(PlanRepository):
+    """Lesson plans kept in a dict, with the same contract as the real repositories."""
+
+    def __init__(self):
+        self.rows: dict[str, dict] = {}
+        self._clock = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+    def _now(self) -> str:
+        # Strictly increasing, so every write gets a new ETag
+        self._clock += timedelta(seconds=1)
+        return self._clock.isoformat()
+
+    def _owned(self, user_id: str, plan_id: str) -> dict | None:
+        row = self.rows.get(plan_id)
+        return row if row and row["user_id"] == user_id else None
+
+    async def list_plans(self, user_id, limit, after=None):
+        rows = sorted(
+            (row for row in self.rows.values() if row["user_id"] == user_id),
+            key=lambda row: (row["created_at"], row["id"]),
+            reverse=True,
+        )
+        return [{column: row.get(column) for column in PLAN_SUMMARY_COLUMNS} for row in rows[:limit]]
+
+    async def search_plans(self, user_id, query, limit, after=None):
+        return []
+
+    async def iter_plans(self, user_id, batch_size):
+        for row in list(self.rows.values()):
+            if row["user_id"] == user_id:
+                yield copy.deepcopy(row)
+
+    async def get_plan(self, user_id, plan_id):
+        row = self._owned(user_id, plan_id)
+        return copy.deepcopy(row) if row else None
+
+    async def get_plan_updated_at(self, user_id, plan_id):
+        row = self._owned(user_id, plan_id)
+        return row["updated_at"] if row else None
+
+    async def insert_plan(self, data):
+        await self.insert_plans([data])
+
+    async def insert_plans(self, rows):
+        for row in rows:
+            now = self._now()
+            self.rows.setdefault(
+                row["id"], {"created_at": now, "updated_at": now, **copy.deepcopy(row)}
+            )
+
+    async def update_plan(self, user_id, plan_id, data, expected_updated_at=None):
+        row = self._owned(user_id, plan_id)
+        if not row or (expected_updated_at and row["updated_at"] != expected_updated_at):
+            return None
+        row.update(copy.deepcopy(data), updated_at=self._now())
+        return row["updated_at"]
+
+    async def delete_plan(self, user_id, plan_id):
+        if self._owned(user_id, plan_id):
+            del self.rows[plan_id]
+
+
+def make_plan_json(segment_count: int) -> dict:
+    """A valid plan document with distinct segments."""
+    segments = [
+        {
+            "name": f"Segment {i}",
+            "duration_seconds": 180 + i,
+            "intensity": ("low", "medium", "high")[i % 3],
+            "position": "standing" if i % 2 else "seated",
+            "description": f"Coaching cue {i}",
+            "suggested_bpm_range": "120-130",
+            "song": f"Song {i} - Artist {i}",
+            "spotify_uri": f"spotify:track:{i:022d}",
+            "song_start_seconds": 0,
+            "song_end_seconds": None,
+            "fade_out": False,
+            "sub_segments": None,
+        }
+        for i in range(segment_count)
+    ]
+    total_seconds = sum(segment["duration_seconds"] for segment in segments)
+    return {
+        "theme": "Test Ride",
+        "total_duration_minutes": (total_seconds + 59) // 60,
+        "segments": segments,
+        "notes": None,
+    }
+
+
+def plan_row(plan_json: dict, user_id: str = USER_ID) -> dict:
+    """A lesson_plans row for a plan document, as the write paths build it."""
+    return {"id": str(uuid.uuid4()), "user_id": user_id, **plan_json_columns(plan_json)}
+
+
+@pytest.fixture
+def repository() -> InMemoryPlanRepository:
+    return InMemoryPlanRepository()
+
+
+@pytest.fixture
+def plan_writer(repository, tmp_path) -> PlanWriteQueue:
+    # Not started: queued plans stay pending until a test writes them
+    return PlanWriteQueue(repository, spool_dir=str(tmp_path / "spool"), max_retries=0)
+
+
+@pytest.fixture
+def client(repository, plan_writer):
+    from main import app
+
+    app.dependency_overrides[get_current_user_id] = lambda: USER_ID
+    app.dependency_overrides[get_plan_repository] = lambda: repository
+    app.dependency_overrides[get_plan_writer] = lambda: plan_writer
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.clear()
@@ -0,0 +1,34 @@
+"""GET /metrics exposes internal counters, so it is only served when enabled."""
+import importlib
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from app.config import get_settings
+
+
+@pytest.fixture
+def reload_main(monkeypatch):
+    """Rebuild the app with the given METRICS_ENABLED value."""
+    def reload(enabled: bool):
+        monkeypatch.setenv("METRICS_ENABLED", "true" if enabled else "false")
+        get_settings.cache_clear()
+        return importlib.reload(main).app
+
+    yield reload
+    monkeypatch.delenv("METRICS_ENABLED")
+    get_settings.cache_clear()
+    importlib.reload(main)
+
+
+def test_metrics_not_served_by_default(reload_main):
+    app = reload_main(False)
+    assert TestClient(app).get("/metrics").status_code == 404
+
+
+def test_metrics_served_when_enabled(reload_main):
+    app = reload_main(True)
+    response = TestClient(app).get("/metrics")
+    assert response.status_code == 200
+    assert isinstance(response.json(), dict)
@@ -0,0 +1,99 @@
+"""
+Plans that are auto-saved in the background: reading, changing and deleting
+them before the write queue has written them.
+"""
+import asyncio
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+
+from conftest import USER_ID, make_plan_json, plan_row
+
+
+def _enqueue(plan_writer) -> dict:
+    # As _save_generated_plan queues a generated plan
+    now = datetime.now(timezone.utc).isoformat()
+    row = {**plan_row(make_plan_json(6)), "created_at": now, "updated_at": now}
+    asyncio.run(plan_writer.enqueue(row))
+    return row
+
+
+def _drain(plan_writer) -> None:
+    """Let the worker write whatever is still queued."""
+    async def run():
+        await plan_writer.start()
+        await plan_writer.close()
+
+    asyncio.run(run())
+
+
+def _spool_files(plan_writer) -> list[Path]:
+    return list(plan_writer._spool_dir.glob("*.json"))
+
+
+def test_pending_plan_is_served_like_a_stored_one(client, plan_writer):
+    row = _enqueue(plan_writer)
+
+    response = client.get(f"/api/plans/{row['id']}")
+    assert response.status_code == 200
+    assert response.headers["etag"]
+    body = response.json()
+    assert body["created_at"] == row["created_at"]
+    assert body["updated_at"] == row["updated_at"]
+    assert body["segment_count"] == 6
+
+
+def test_deleting_a_pending_plan_keeps_it_deleted(client, repository, plan_writer):
+    row = _enqueue(plan_writer)
+    assert _spool_files(plan_writer)
+
+    assert client.delete(f"/api/plans/{row['id']}").status_code == 200
+    assert client.get(f"/api/plans/{row['id']}").status_code == 404
+    assert not _spool_files(plan_writer)
+
+    # The queued insert must not bring it back
+    _drain(plan_writer)
+    assert row["id"] not in repository.rows
+    assert client.get(f"/api/plans/{row['id']}").status_code == 404
+
+
+def test_updating_a_pending_plan(client, repository, plan_writer):
+    row = _enqueue(plan_writer)
+    etag = client.get(f"/api/plans/{row['id']}").headers["etag"]
+
+    plan = {**row["plan_json"], "notes": "Edited right after generating"}
+    response = client.put(f"/api/plans/{row['id']}", json={"plan": plan}, headers={"If-Match": etag})
+    assert response.status_code == 200, response.text
+    assert not _spool_files(plan_writer)
+
+    _drain(plan_writer)
+    stored = client.get(f"/api/plans/{row['id']}").json()
+    assert stored["plan_json"]["notes"] == "Edited right after generating"
+    assert repository.rows[row["id"]]["plan_json"]["notes"] == "Edited right after generating"
+
+
+def test_patching_a_pending_plan(client, repository, plan_writer):
+    row = _enqueue(plan_writer)
+    etag = client.get(f"/api/plans/{row['id']}").headers["etag"]
+
+    ops = [{"op": "replace", "path": "/segments/0/name", "value": "Warm-Up"}]
+    response = client.patch(
+        f"/api/plans/{row['id']}",
+        content=json.dumps(ops),
+        headers={"Content-Type": "application/json-patch+json", "If-Match": etag},
+    )
+    assert response.status_code == 200, response.text
+
+    _drain(plan_writer)
+    stored = client.get(f"/api/plans/{row['id']}").json()
+    assert stored["plan_json"]["segments"][0]["name"] == "Warm-Up"
+
+
+def test_other_users_cannot_touch_a_pending_plan(client, repository, plan_writer):
+    row = _enqueue(plan_writer)
+    assert not asyncio.run(plan_writer.discard("someone-else", row["id"]))
+    assert not asyncio.run(plan_writer.flush("someone-else", row["id"]))
+    assert plan_writer.get_pending(USER_ID, row["id"])
+
+    _drain(plan_writer)
+    assert row["id"] in repository.rows
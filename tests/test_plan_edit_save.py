@@ -0,0 +1,139 @@
+"""
+Saving edits from the plan editor: the editor's JSON Patch diff (run under
+Node, straight from the template) against the PATCH/PUT endpoints.
+"""
+import asyncio
+import json
+import re
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from app.routers.plans import MAX_PATCH_OPERATIONS
+from conftest import make_plan_json, plan_row
+
+TEMPLATE = Path(__file__).resolve().parent.parent / "app" / "templates" / "plan_edit.html"
+
+
+def _diff_plan_source() -> str:
+    """The editor's diffPlan() and the helpers it uses, cut from the template."""
+    source = TEMPLATE.read_text()
+    start = source.index("// Keep in sync with MAX_PATCH_OPERATIONS")
+    end = source.index("function putPlan(")
+    return source[start:end]
+
+
+def diff_plan(saved: dict, edited: dict) -> list[dict]:
+    if not shutil.which("node"):
+        pytest.skip("node not installed")
+    script = _diff_plan_source() + (
+        "const input = JSON.parse(require('fs').readFileSync(0, 'utf8'));\n"
+        "process.stdout.write(JSON.stringify(diffPlan(input.saved, input.edited)));\n"
+    )
+    result = subprocess.run(
+        ["node", "-e", script],
+        input=json.dumps({"saved": saved, "edited": edited}),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout)
+
+
+def _store(repository, plan_json: dict) -> str:
+    row = plan_row(plan_json)
+    asyncio.run(repository.insert_plans([row]))
+    return row["id"]
+
+
+def _get(client, plan_id: str):
+    response = client.get(f"/api/plans/{plan_id}")
+    assert response.status_code == 200
+    return response.json(), response.headers["etag"]
+
+
+def _patch(client, plan_id: str, ops: list[dict], etag: str):
+    return client.patch(
+        f"/api/plans/{plan_id}",
+        content=json.dumps(ops),
+        headers={"Content-Type": "application/json-patch+json", "If-Match": etag},
+    )
+
+
+def test_js_op_limit_matches_server():
+    match = re.search(r"const MAX_PATCH_OPERATIONS = (\d+);", _diff_plan_source())
+    assert match and int(match.group(1)) == MAX_PATCH_OPERATIONS
+
+
+def test_reordering_a_large_plan_saves(client, repository):
+    plan_id = _store(repository, make_plan_json(30))
+    saved, etag = _get(client, plan_id)
+
+    # Move Down on the first segment until it is last
+    edited = json.loads(json.dumps(saved["plan_json"]))
+    edited["segments"].append(edited["segments"].pop(0))
+
+    ops = diff_plan(saved["plan_json"], edited)
+    assert len(ops) <= MAX_PATCH_OPERATIONS
+    assert ops == [{"op": "replace", "path": "/segments", "value": edited["segments"]}]
+
+    response = _patch(client, plan_id, ops, etag)
+    assert response.status_code == 200, response.text
+    stored, _ = _get(client, plan_id)
+    assert [s["name"] for s in stored["plan_json"]["segments"]] == [s["name"] for s in edited["segments"]]
+
+
+def test_rewriting_every_segment_stays_under_the_limit(client, repository):
+    plan_id = _store(repository, make_plan_json(30))
+    saved, etag = _get(client, plan_id)
+
+    edited = json.loads(json.dumps(saved["plan_json"]))
+    for i, segment in enumerate(edited["segments"]):
+        segment.update(
+            name=f"New {i}", description=f"New cue {i}", song=f"New song {i}", spotify_uri="",
+            suggested_bpm_range="90-100", song_start_seconds=5, fade_out=True,
+        )
+
+    ops = diff_plan(saved["plan_json"], edited)
+    assert len(ops) <= MAX_PATCH_OPERATIONS
+    response = _patch(client, plan_id, ops, etag)
+    assert response.status_code == 200, response.text
+    stored, _ = _get(client, plan_id)
+    assert [s["name"] for s in stored["plan_json"]["segments"]] == [f"New {i}" for i in range(30)]
+
+
+def test_small_edit_is_a_field_patch(client, repository):
+    plan_id = _store(repository, make_plan_json(20))
+    saved, etag = _get(client, plan_id)
+
+    edited = json.loads(json.dumps(saved["plan_json"]))
+    edited["segments"][3]["name"] = "Hill Attack"
+
+    ops = diff_plan(saved["plan_json"], edited)
+    assert ops == [{"op": "add", "path": "/segments/3/name", "value": "Hill Attack"}]
+    assert _patch(client, plan_id, ops, etag).status_code == 200
+
+
+def test_too_many_operations_falls_back_to_put(client, repository):
+    plan_id = _store(repository, make_plan_json(20))
+    saved, etag = _get(client, plan_id)
+    edited = json.loads(json.dumps(saved["plan_json"]))
+    edited["notes"] = "Saved in full"
+
+    ops = [{"op": "add", "path": "/notes", "value": "x"}] * (MAX_PATCH_OPERATIONS + 1)
+    response = _patch(client, plan_id, ops, etag)
+    # The editor recognizes this error and retries with PUT
+    assert response.status_code == 422
+    assert "operations per patch" in response.json()["detail"]
+
+    response = client.put(f"/api/plans/{plan_id}", json={"plan": edited}, headers={"If-Match": etag})
+    assert response.status_code == 200, response.text
+    assert response.headers["etag"] != etag
+    stored, _ = _get(client, plan_id)
+    assert stored["plan_json"]["notes"] == "Saved in full"
+
+    # The fallback PUT is still guarded by the ETag the editor loaded
+    response = client.put(f"/api/plans/{plan_id}", json={"plan": edited}, headers={"If-Match": etag})
+    assert response.status_code == 412
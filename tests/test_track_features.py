@@ -0,0 +1,98 @@
+"""Hedged audio features lookups: when Spotify keeps failing, GetSongBPM starts right away."""
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.services import track_features
+
+
+class EmptyFeaturesTable:
+    """Stands in for the Supabase client: track_features is empty and writes are dropped."""
+
+    def table(self, name: str) -> "EmptyFeaturesTable":
+        return self
+
+    def __getattr__(self, name: str):
+        return lambda *args, **kwargs: self
+
+    async def execute(self):
+        return type("Response", (), {"data": []})()
+
+
+def _spotify(handler) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+async def _timeout(request: httpx.Request) -> httpx.Response:
+    raise httpx.ReadTimeout("timed out", request=request)
+
+
+@pytest.fixture(autouse=True)
+def reset_state(monkeypatch):
+    monkeypatch.setattr(track_features, "_spotify_miss_streak", 0)
+    track_features._memory_cache.clear()
+    yield
+    track_features._memory_cache.clear()
+
+
+def test_spotify_errors_count_as_misses():
+    async def run():
+        async with _spotify(_timeout) as http_client:
+            for _ in range(2):
+                with pytest.raises(httpx.ReadTimeout):
+                    await track_features._lookup_spotify(http_client, "track", "token")
+
+    asyncio.run(run())
+    assert track_features._spotify_miss_streak == 2
+
+
+def test_spotify_hit_resets_the_streak(monkeypatch):
+    monkeypatch.setattr(track_features, "_spotify_miss_streak", 5)
+
+    def handler(request):
+        return httpx.Response(200, json={"id": "track", "tempo": 128.0, "energy": 0.7})
+
+    async def run():
+        async with _spotify(handler) as http_client:
+            return await track_features._lookup_spotify(http_client, "track", "token")
+
+    assert asyncio.run(run())["tempo"] == 128.0
+    assert track_features._spotify_miss_streak == 0
+
+
+def test_failing_spotify_stops_getting_a_head_start(monkeypatch):
+    hedge_delay = track_features.get_settings().audio_features_hedge_delay_seconds
+    started = []
+
+    async def slow_timeout(request):
+        await asyncio.sleep(hedge_delay * 2)
+        raise httpx.ReadTimeout("timed out", request=request)
+
+    async def getsongbpm(http_client, getsongbpm_client, track_id, access_token):
+        started.append(time.monotonic())
+        return {"tempo": 100.0}
+
+    monkeypatch.setattr(track_features, "_lookup_getsongbpm", getsongbpm)
+
+    async def resolve(spotify_handler, track_id: str) -> float:
+        """Resolve a track; returns how long GetSongBPM waited to start."""
+        async with _spotify(spotify_handler) as http_client:
+            start = time.monotonic()
+            features = await track_features.resolve_audio_features(
+                EmptyFeaturesTable(), http_client, http_client, track_id, "token"
+            )
+            assert features["source"] == track_features.SOURCE_GETSONGBPM
+            return started[-1] - start
+
+    # Spotify gets its head start while it hasn't failed yet
+    assert asyncio.run(resolve(slow_timeout, "track-0")) >= hedge_delay
+
+    # Spotify errors (e.g. rate limited) on every lookup...
+    for i in range(track_features.SPOTIFY_MISS_STREAK_LIMIT):
+        asyncio.run(resolve(_timeout, f"track-failing-{i}"))
+    assert track_features._spotify_miss_streak == track_features.SPOTIFY_MISS_STREAK_LIMIT
+
+    # ...so the next lookup starts GetSongBPM immediately
+    assert asyncio.run(resolve(slow_timeout, "track-next")) < hedge_delay